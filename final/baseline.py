@@ -0,0 +1,132 @@
+import numpy as np
+
+from landmarks import NOSE, KNEES, ANKLES, Y
+
+# Baselines the estimator tracks, in the order of its value arrays
+BASELINE_NAMES = ("FloorY", "Height", "KneeLevel")
+
+# Landmarks the baselines are measured from; all must be in view
+BASELINE_JOINTS = np.concatenate([[NOSE], KNEES, ANKLES])
+
+
+def measure_baselines(landmarks):
+    """This frame's floor y (ankles), nose-to-floor height and knee y, as a float64 array."""
+    floor_y = float(landmarks[ANKLES, Y].mean())
+    return np.array([floor_y, float(landmarks[NOSE, Y]) - floor_y, float(landmarks[KNEES, Y].mean())])
+
+
+class BaselineEstimator:
+    """
+    Keeps the floor, height and knee baselines calibrated while the game runs.
+
+    Each frame's measurements go into a ring of the last `window` frames,
+    with a running sum and sum of squares, so adding a frame and checking
+    whether the player is standing still are O(1). The player counts as
+    still when the window spans at least min_duration seconds and every
+    measurement's standard deviation is under still_tolerance body heights.
+
+    While the player is still, a trimmed mean of the window (the highest
+    and lowest trim fraction of frames dropped, so a few bad detections do
+    not count) is taken at most every refresh seconds. Near the current baselines it is
+    blended in by blend. Further than shift body heights away (the camera
+    moved, or the player stepped closer or further back), the baselines
+    are replaced, but only once the new values have held for confirm_time
+    seconds; holding a squat for a moment does not re-baseline.
+
+    Until the player has stood still once, the first frame's measurements
+    are used, like the old single-frame calibration.
+    """
+
+    def __init__(self, window=30, min_duration=0.5, still_tolerance=0.015, trim=0.2, refresh=0.5,
+                 blend=0.2, shift=0.08, confirm_time=1.0):
+        self.window = window
+        self.min_duration = min_duration
+        self.still_tolerance = still_tolerance
+        self.trim = int(window * trim)
+        self.refresh = refresh
+        self.blend = blend
+        self.shift = shift
+        self.confirm_time = confirm_time
+
+        self.samples = np.zeros((window, len(BASELINE_NAMES)))
+        self.times = np.zeros(window)
+        self.total = np.zeros(len(BASELINE_NAMES))
+        self.total_squares = np.zeros(len(BASELINE_NAMES))
+        self.recalibrations = 0
+        self.reset()
+
+    def reset(self):
+        """Forget everything; the next frame sets provisional baselines."""
+        self.head = 0
+        self.count = 0
+        self.total.fill(0.0)
+        self.total_squares.fill(0.0)
+        self.values = None
+        self.calibrated = False  # True once the baselines come from a still window
+        self.last_estimate_time = -np.inf
+        self.candidate = None  # Still-window values that disagree with the baselines
+        self.candidate_since = None
+
+    def is_still(self):
+        """True if the window is full and its measurements barely move. O(1)."""
+        if self.count < self.window:
+            return False
+        newest = self.times[(self.head - 1) % self.window]
+        if newest - self.times[self.head] < self.min_duration:
+            return False
+        mean = self.total / self.window
+        variance = np.maximum(self.total_squares / self.window - mean * mean, 0.0)
+        scale = max(abs(mean[1]), 1e-3)
+        return bool((np.sqrt(variance) < self.still_tolerance * scale).all())
+
+    def _trimmed_mean(self):
+        ordered = np.sort(self.samples, axis=0)
+        return ordered[self.trim:self.window - self.trim].mean(axis=0)
+
+    def update(self, t, landmarks):
+        """
+        Add one frame captured at time t. Returns the new baseline values
+        (in BASELINE_NAMES order) when they changed, otherwise None.
+        """
+        measured = measure_baselines(landmarks)
+        slot = self.head
+        if self.count >= self.window:
+            old = self.samples[slot]
+            self.total -= old
+            self.total_squares -= old * old
+        self.samples[slot] = measured
+        self.times[slot] = t
+        self.total += measured
+        self.total_squares += measured * measured
+        self.head = (slot + 1) % self.window
+        self.count += 1
+
+        if self.values is None:
+            self.values = measured
+            return self.values
+        if t - self.last_estimate_time < self.refresh or not self.is_still():
+            return None
+        self.last_estimate_time = t
+        estimate = self._trimmed_mean()
+
+        if not self.calibrated:
+            self.values = estimate
+            self.calibrated = True
+            return self.values
+
+        scale = max(abs(self.values[1]), 1e-3)
+        if np.abs(estimate - self.values).max() <= self.shift * scale:
+            self.candidate = None
+            self.values = self.values + self.blend * (estimate - self.values)
+            return self.values
+
+        # Far from the baselines: replace them once the same new values have held for a while
+        if self.candidate is None or np.abs(estimate - self.candidate).max() > self.shift * scale:
+            self.candidate, self.candidate_since = estimate, t
+            return None
+        if t - self.candidate_since < self.confirm_time:
+            return None
+        self.candidate = None
+        self.values = estimate
+        self.recalibrations += 1
+        return self.values
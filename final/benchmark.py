@@ -0,0 +1,247 @@
+"""
+Replay a recorded clip through PoseController and measure latency.
+
+The clip is played by a VideoFileSource paced to its own frame rate, so the
+pipeline sees it the way it would see a webcam. A 60 Hz loop stands in for
+the game: it reads controls, reports display flips and watches for the
+jump and block events listed in an events file.
+
+    python benchmark.py test.mp4 --events test_events.json --output run.json
+    python benchmark.py --compare before.json after.json
+
+To compare two backends on the same input, run the clip once with each:
+
+    python benchmark.py test.mp4 --backend legacy --output legacy.json
+    python benchmark.py test.mp4 --backend tasks --model-path pose_landmarker_full.task --output tasks.json
+    python benchmark.py --compare legacy.json tasks.json
+
+The events file is a JSON list of known moments in the clip, in seconds:
+
+    [{"time": 2.4, "type": "jump"},
+     {"time": 5.1, "type": "block", "block_type": "Left"}]
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from camera import VideoFileSource
+from cv_controller import PoseController
+from pose_backends import BACKENDS
+
+GAME_FPS = 60
+
+
+def _summary(values):
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "max": None}
+    values = np.array(values)
+    return {
+        "count": len(values),
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "max": float(values.max()),
+    }
+
+
+def _matches(event, observation):
+    if event["type"] == "jump":
+        return observation["jump"]
+    if event["type"] == "block":
+        expected = event.get("block_type")
+        if expected is None:
+            return observation["block_type"] != "None"
+        return observation["block_type"] == expected
+    raise ValueError(f"Unknown event type: {event['type']}")
+
+
+def match_events(events, observations, start_time, match_window=1.5):
+    """
+    For each known event, find the first new snapshot at or after it that
+    shows the event, and how long after the event the game loop saw it.
+    """
+    results = []
+    for event in events:
+        event_time = start_time + event["time"]
+        hit = None
+        for observation in observations:
+            if observation["seen_time"] < event_time:
+                continue
+            if observation["seen_time"] > event_time + match_window:
+                break
+            if _matches(event, observation):
+                hit = observation
+                break
+        result = dict(event)
+        result["detected"] = hit is not None
+        if hit is not None:
+            # Glass-to-game: event on screen to the game loop acting on it
+            result["latency_ms"] = (hit["seen_time"] - event_time) * 1000.0
+            # Event to the snapshot being published by the inference thread
+            result["pipeline_latency_ms"] = (hit["inference_time"] - event_time) * 1000.0
+            result["sequence"] = hit["sequence"]
+        results.append(result)
+    return results
+
+
+def run_benchmark(clip, events=(), label=None, tail=1.0, match_window=1.5, **controller_options):
+    """Play clip through a PoseController and return a dictionary of results."""
+    source = VideoFileSource(clip, realtime=True)
+    controller = PoseController(**controller_options)
+    controller.start_camera(source)
+    if not source.is_opened():
+        controller.close()
+        raise RuntimeError(f"Could not open clip: {clip}")
+
+    duration = source.frame_count / source.fps if source.frame_count else 0.0
+    end_time = source.start_time + duration + tail
+    observations = []
+    last_sequence = 0
+    last_block_type = "None"
+
+    # Stand-in for VolleyballGame.run
+    frame_period = 1.0 / GAME_FPS
+    next_frame = time.monotonic()
+    while time.monotonic() < end_time:
+        now = time.monotonic()
+        controls = controller.get_player_controls(now)
+        snapshot = controller.get_snapshot()
+        # With prediction on, the block can change between camera frames
+        if snapshot.sequence != last_sequence or controls["block_type"] != last_block_type:
+            last_sequence = snapshot.sequence
+            last_block_type = controls["block_type"]
+            observations.append({
+                "sequence": snapshot.sequence,
+                "seen_time": now,
+                "capture_time": snapshot.capture_time,
+                "inference_time": snapshot.inference_time,
+                "jump": controls["jump"],
+                "block_type": controls["block_type"],
+            })
+        controller.frame_displayed(controls['sequence'])
+
+        next_frame += frame_period
+        delay = next_frame - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    stats = controller.get_stats()
+    latency_report = controller.get_latency_report()
+    controller.close()
+
+    event_results = match_events(events, observations, source.start_time, match_window)
+    detected = [e["latency_ms"] for e in event_results if e["detected"]]
+    return {
+        "label": label,
+        "clip": clip,
+        "options": controller_options,
+        "clip_fps": source.fps,
+        "clip_frames": source.frame_count,
+        "clip_duration": duration,
+        "throughput_fps": stats["frames_processed"] / duration if duration else 0.0,
+        "frames_captured": stats["frames_captured"],
+        "frames_processed": stats["frames_processed"],
+        "frames_dropped": stats["frames_dropped"] + source.frames_skipped,
+        "frames_with_pose": len({o["sequence"] for o in observations}),
+        "events": event_results,
+        "events_detected": len(detected),
+        "events_missed": len(event_results) - len(detected),
+        "detection_latency_ms": _summary(detected),
+        "stages_ms": latency_report,
+    }
+
+
+# Metrics printed by --compare, with the direction that counts as better
+COMPARE_METRICS = [
+    ("throughput_fps", "higher"),
+    ("frames_dropped", "lower"),
+    ("events_detected", "higher"),
+    ("detection_latency_ms.p50", "lower"),
+    ("detection_latency_ms.p95", "lower"),
+    ("stages_ms.inference.p50", "lower"),
+    ("stages_ms.end_to_end.p50", "lower"),
+    ("stages_ms.end_to_end.p95", "lower"),
+]
+
+
+def _lookup(results, path):
+    value = results
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare_results(before, after):
+    """Return (metric, before, after, change) rows for two benchmark results."""
+    rows = []
+    for metric, better in COMPARE_METRICS:
+        old = _lookup(before, metric)
+        new = _lookup(after, metric)
+        if old is None or new is None:
+            rows.append((metric, old, new, None))
+            continue
+        change = new - old
+        improved = change > 0 if better == "higher" else change < 0
+        rows.append((metric, old, new, f"{change:+.2f} ({'better' if improved else 'worse' if change else 'same'})"))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a clip through PoseController and measure latency.")
+    parser.add_argument("clip", nargs="?", default="test.mp4", help="recorded video to replay")
+    parser.add_argument("--events", help="JSON list of known jump / block events in the clip")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--label", help="name for this run in the results")
+    parser.add_argument("--backend", default="legacy", choices=list(BACKENDS), help="pose backend to benchmark")
+    parser.add_argument("--model-path", help="model bundle for the tasks backend")
+    parser.add_argument("--roi", action="store_true", help="enable ROI-cropped inference")
+    parser.add_argument("--mirror", default="pixels", choices=["pixels", "landmarks"], help="how to mirror")
+    parser.add_argument("--smoothing", action="store_true", help="filter landmarks with the One Euro filter")
+    parser.add_argument("--prediction", action="store_true", help="forecast landmarks to render time")
+    parser.add_argument("--block-table", action="store_true", help="classify blocks with the lookup table")
+    parser.add_argument("--budget", type=float, default=None, help="latency budget in ms for the quality governor")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two results files")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            before = json.load(f)
+        with open(args.compare[1]) as f:
+            after = json.load(f)
+        for metric, old, new, change in compare_results(before, after):
+            old = f"{old:.2f}" if isinstance(old, float) else str(old)
+            new = f"{new:.2f}" if isinstance(new, float) else str(new)
+            print(f"{metric:32} {old:>12} {new:>12}  {change or ''}")
+        return
+
+    events = []
+    if args.events:
+        with open(args.events) as f:
+            events = json.load(f)
+
+    backend_options = {"model_path": args.model_path} if args.model_path else None
+    results = run_benchmark(
+        args.clip, events, label=args.label or args.backend,
+        backend=args.backend, roi_mode=args.roi, mirror=args.mirror, latency_budget_ms=args.budget,
+        backend_options=backend_options, smoothing=args.smoothing, prediction=args.prediction,
+        block_classifier="table" if args.block_table else "rules",
+    )
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    print(f"{results['throughput_fps']:.1f} FPS, {results['frames_dropped']} dropped, "
+          f"{results['events_detected']}/{len(events)} events, "
+          f"detection p50 {results['detection_latency_ms']['p50']} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Block classification by table lookup.
+
+The block rules only look at five things: how far each elbow is above its
+shoulder, how far each wrist is left or right of the nose, and how far
+apart the wrists are. Each of those is cut into a few bins, and the block
+class of every combination of bins is worked out ahead of time and stored
+in a small uint8 table. Classifying a pose is then five subtractions (one
+hypot), a scale and clip to bin numbers, and one array index.
+
+Build the table from the block_type classifier in the rule file, or from
+recorded landmarks with their true block labels (cells the recording never
+visits fall back to the rules), then check it against the rule kernel:
+
+    python block_table.py build
+    python block_table.py build --labels labeled_blocks.npz
+    python block_table.py verify
+    python block_table.py verify --landmarks recorded.npz
+
+A labels file is an .npz with a (N, 33, 4) "landmarks" array and a (N,)
+"labels" array of block names.
+"""
+import argparse
+import hashlib
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from landmarks import (LANDMARK_COUNT, LANDMARK_FIELDS, LANDMARK_NAMES, X, Y, VISIBILITY, NOSE,
+                       LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_ELBOW, RIGHT_ELBOW, LEFT_WRIST, RIGHT_WRIST,
+                       SHOULDERS, ELBOWS, WRISTS)
+from pose_rules import DEFAULT_RULES_PATH, load_rules
+
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "block_table.npz")
+
+# Features, as (name, low, high, bins). Bins are equal width, and the rule
+# thresholds (0 for the offsets, 0.2 for the wrist distance) sit on bin
+# edges, so no bin straddles a rule and the table matches the rules exactly.
+# Values outside the range land in the end bins.
+FEATURES = (
+    ("left_elbow_drop", -0.4, 0.4, 8),    # Elbow y minus shoulder y, negative when raised
+    ("right_elbow_drop", -0.4, 0.4, 8),
+    ("left_wrist_offset", -0.4, 0.4, 8),  # Wrist x minus nose x
+    ("right_wrist_offset", -0.4, 0.4, 8),
+    ("wrist_spread", 0.0, 0.8, 8),        # Distance between the wrists
+)
+FEATURE_LOW = np.array([f[1] for f in FEATURES])
+FEATURE_SCALE = np.array([f[3] / (f[2] - f[1]) for f in FEATURES])
+FEATURE_BINS = np.array([f[3] for f in FEATURES])
+CELL_COUNT = int(np.prod(FEATURE_BINS))
+# Flat table index of a cell is bins @ FEATURE_STRIDES
+FEATURE_STRIDES = np.array([int(np.prod(FEATURE_BINS[i + 1:])) for i in range(len(FEATURES))])
+# Plain Python copies for classifying one pose, where numpy scalars are slower than floats
+FEATURE_GRID = tuple(zip(FEATURE_LOW.tolist(), FEATURE_SCALE.tolist(), FEATURE_BINS.tolist(),
+                         FEATURE_STRIDES.tolist()))
+
+# Landmarks the features read. A block rule that reads anything else cannot be tabled.
+FEATURE_JOINTS = np.concatenate([[NOSE], SHOULDERS, ELBOWS, WRISTS])
+
+
+def block_features(landmarks):
+    """(..., 5) features of a (..., 33, 4) pose, in FEATURES order."""
+    elbow_drop = landmarks[..., ELBOWS, Y] - landmarks[..., SHOULDERS, Y]
+    wrist_offset = landmarks[..., WRISTS, X] - landmarks[..., NOSE, None, X]
+    spread = np.hypot(landmarks[..., WRISTS[0], X] - landmarks[..., WRISTS[1], X],
+                      landmarks[..., WRISTS[0], Y] - landmarks[..., WRISTS[1], Y])
+    return np.concatenate([elbow_drop, wrist_offset, spread[..., None]], axis=-1)
+
+
+def feature_cells(features):
+    """Flat table index of each feature row."""
+    bins = ((features - FEATURE_LOW) * FEATURE_SCALE).astype(np.intp)
+    np.clip(bins, 0, FEATURE_BINS - 1, out=bins)
+    return bins @ FEATURE_STRIDES
+
+
+def rules_digest(rules_path=DEFAULT_RULES_PATH):
+    """Fingerprint of the rule file, so a table built from older rules can be spotted."""
+    with open(rules_path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class BlockTable:
+    """
+    Precomputed block class for every cell of the feature grid.
+
+    classify() gives the same answer as the block_type rules for any pose
+    whose shoulders, elbows, wrists and nose are in view; verify() measures
+    how often that holds.
+    """
+
+    def __init__(self, table, names, digest=None, source="rules"):
+        self.table = np.asarray(table, dtype=np.uint8)
+        self.names = tuple(names)
+        self.digest = digest
+        self.source = source
+
+    def classify(self, landmarks):
+        """Block type name of one (33, 4) pose."""
+        x = landmarks[:, X].tolist()
+        y = landmarks[:, Y].tolist()
+        values = (y[LEFT_ELBOW] - y[LEFT_SHOULDER], y[RIGHT_ELBOW] - y[RIGHT_SHOULDER],
+                  x[LEFT_WRIST] - x[NOSE], x[RIGHT_WRIST] - x[NOSE],
+                  math.hypot(x[LEFT_WRIST] - x[RIGHT_WRIST], y[LEFT_WRIST] - y[RIGHT_WRIST]))
+        cell = 0
+        for value, (low, scale, bins, stride) in zip(values, FEATURE_GRID):
+            b = int((value - low) * scale)
+            cell += stride * (0 if b < 0 else bins - 1 if b >= bins else b)
+        return self.names[self.table[cell]]
+
+    def classify_batch(self, landmarks):
+        """Block type names of a (N, 33, 4) batch, as an object array."""
+        return np.asarray(self.names, dtype=object)[self.table[feature_cells(block_features(landmarks))]]
+
+    def save(self, path=DEFAULT_TABLE_PATH):
+        np.savez_compressed(path, table=self.table, names=np.array(self.names),
+                            digest=np.array(self.digest or ""), source=np.array(self.source))
+
+    @classmethod
+    def load(cls, path=DEFAULT_TABLE_PATH):
+        with np.load(path) as data:
+            if data["table"].shape != (CELL_COUNT,):
+                raise ValueError(f"{path} was built for a different feature grid")
+            return cls(data["table"], [str(n) for n in data["names"]], str(data["digest"]) or None,
+                       str(data["source"]))
+
+
+def _check_rules(rules):
+    """Raise if the block_type rules read anything the features do not cover."""
+    columns, _ = rules.classifiers["block_type"]
+    joints = np.nonzero(rules.rule_joints[columns].any(axis=0))[0]
+    extra = sorted(set(joints.tolist()) - set(FEATURE_JOINTS.tolist()))
+    if extra or rules.rule_uses_baselines[columns].any():
+        names = [LANDMARK_NAMES[index] for index in extra]
+        raise ValueError("block_type rules read more than the table's features"
+                         + (f": {', '.join(names)}" if names else ": a baseline"))
+
+
+def _synthesize(features):
+    """
+    Poses with the given features, and a mask of the feature rows that had
+    one. Rows with the wrists further apart sideways than the wrist spread
+    allows are dropped, since no pose has them.
+    """
+    lateral = features[:, 3] - features[:, 2]
+    feasible = np.abs(lateral) <= features[:, 4]
+    features = features[feasible]
+    poses = np.zeros((len(features), LANDMARK_COUNT, LANDMARK_FIELDS), dtype=np.float32)
+    poses[:, :, VISIBILITY] = 1.0
+    poses[:, NOSE, X], poses[:, NOSE, Y] = 0.5, 0.3
+    poses[:, SHOULDERS, X] = [0.4, 0.6]
+    poses[:, SHOULDERS, Y] = 0.4
+    poses[:, ELBOWS, X] = [0.35, 0.65]
+    poses[:, ELBOWS, Y] = 0.4 + features[:, 0:2]
+    poses[:, WRISTS, X] = 0.5 + features[:, 2:4]
+    poses[:, WRISTS[0], Y] = 0.5
+    poses[:, WRISTS[1], Y] = 0.5 + np.sqrt(features[:, 4] ** 2 - (lateral[feasible]) ** 2)
+    return poses, feasible
+
+
+def _cell_points(grid, rng=None, margin=1e-4):
+    """
+    One feature point inside each cell of grid (rows of bin numbers): a
+    random one, or without rng the one most likely to be a real pose, with
+    the wrists as close sideways and the spread as wide as the cell allows.
+    """
+    lower = FEATURE_LOW + grid / FEATURE_SCALE
+    upper = lower + 1.0 / FEATURE_SCALE
+    # The end bins also hold everything beyond the range
+    lower = np.where(grid == 0, lower - 1.0, lower) + margin
+    upper = np.where(grid == FEATURE_BINS - 1, upper + 1.0, upper) - margin
+    if rng is not None:
+        return lower + rng.random(grid.shape) * (upper - lower)
+    points = (lower + upper) / 2
+    points[:, 2] = np.clip(points[:, 3], lower[:, 2], upper[:, 2])
+    points[:, 3] = np.clip(points[:, 2], lower[:, 3], upper[:, 3])
+    points[:, 4] = upper[:, 4]
+    return points
+
+
+def build_from_rules(rules=None, rules_path=DEFAULT_RULES_PATH, samples_per_cell=8, seed=0):
+    """
+    Label every cell with the rule kernel's block class at feature points
+    inside it, taking the majority if they disagree (only possible if a
+    rule threshold falls inside a bin). Cells no real pose reaches keep
+    the default class.
+    """
+    if rules is None:
+        rules = load_rules(rules_path)
+    _check_rules(rules)
+    _, names = rules.classifiers["block_type"]
+    name_index = {name: i for i, name in enumerate(names)}
+    rng = np.random.default_rng(seed)
+
+    # Bin numbers of every cell, in table order
+    grid = np.indices(FEATURE_BINS).reshape(len(FEATURES), -1).T
+    counts = np.zeros((CELL_COUNT, len(names)), dtype=np.int64)
+    for sample in range(samples_per_cell):
+        poses, feasible = _synthesize(_cell_points(grid, rng if sample else None))
+        results = rules.evaluate(poses, [0.0] * len(rules.baseline_names))
+        label_index = [name_index[label] for label in rules.classify(results, "block_type")]
+        np.add.at(counts, (np.nonzero(feasible)[0], label_index), 1)
+
+    # The last name is the classifier's default
+    table = np.where(counts.any(axis=1), counts.argmax(axis=1), len(names) - 1)
+    return BlockTable(table, names, rules_digest(rules_path), "rules")
+
+
+def build_from_labels(landmarks, labels, fallback):
+    """Majority label of the recorded poses in each cell; empty cells keep fallback's class."""
+    names = fallback.names
+    label_index = np.array([names.index(str(label)) for label in labels])
+    counts = np.zeros((CELL_COUNT, len(names)), dtype=np.int64)
+    np.add.at(counts, (feature_cells(block_features(np.asarray(landmarks, dtype=np.float32))), label_index), 1)
+    table = np.where(counts.any(axis=1), counts.argmax(axis=1), fallback.table)
+    return BlockTable(table, names, fallback.digest, "labels")
+
+
+def load_block_table(path=DEFAULT_TABLE_PATH, rules=None, rules_path=DEFAULT_RULES_PATH):
+    """The saved table, or one built from the rules if it is missing or older than the rule file."""
+    if os.path.exists(path):
+        table = BlockTable.load(path)
+        if table.digest == rules_digest(rules_path):
+            return table
+        print(f"Warning: {path} was built from different rules; building a new table from the rules")
+    return build_from_rules(rules, rules_path)
+
+
+def random_poses(count, seed=1):
+    """Random upper-body poses around a standing player, for verification."""
+    rng = np.random.default_rng(seed)
+    poses = np.zeros((count, LANDMARK_COUNT, LANDMARK_FIELDS), dtype=np.float32)
+    poses[:, :, X] = rng.uniform(0.2, 0.8, (count, LANDMARK_COUNT))
+    poses[:, :, Y] = rng.uniform(0.1, 0.9, (count, LANDMARK_COUNT))
+    poses[:, :, VISIBILITY] = 1.0
+    poses[:, NOSE, Y] = rng.uniform(0.15, 0.35, count)
+    poses[:, SHOULDERS, Y] = rng.uniform(0.3, 0.45, (count, 2))
+    return poses
+
+
+def verify(table, landmarks, rules):
+    """
+    Compare the table with the rule kernel on a batch of poses. Returns
+    (agreement, mismatches) where mismatches counts (rules, table) pairs.
+    """
+    expected = rules.classify(rules.evaluate(landmarks, [0.0] * len(rules.baseline_names)), "block_type")
+    actual = table.classify_batch(landmarks)
+    wrong = expected != actual
+    mismatches = {}
+    for pair in zip(expected[wrong], actual[wrong]):
+        mismatches[pair] = mismatches.get(pair, 0) + 1
+    return 1.0 - wrong.mean() if len(landmarks) else 1.0, mismatches
+
+
+def _time_per_pose(classify, poses):
+    start = time.perf_counter()
+    for pose in poses:
+        classify(pose)
+    return (time.perf_counter() - start) / len(poses) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or check the block type lookup table.")
+    parser.add_argument("command", choices=["build", "verify"])
+    parser.add_argument("--table", default=DEFAULT_TABLE_PATH, help="table file to write or check")
+    parser.add_argument("--rules", default=DEFAULT_RULES_PATH, help="rule file the table follows")
+    parser.add_argument("--labels", help="build from labeled poses in this .npz instead of the rules alone")
+    parser.add_argument("--landmarks", help="verify on the poses in this .npz as well as random ones")
+    parser.add_argument("--samples", type=int, default=200000, help="random poses to verify on")
+    args = parser.parse_args()
+    rules = load_rules(args.rules)
+
+    if args.command == "build":
+        table = build_from_rules(rules, args.rules)
+        if args.labels:
+            with np.load(args.labels) as data:
+                table = build_from_labels(data["landmarks"], data["labels"], table)
+        table.save(args.table)
+        print(f"Wrote {args.table}: {CELL_COUNT} cells from {table.source}, "
+              f"{os.path.getsize(args.table)} bytes")
+        return
+
+    table = BlockTable.load(args.table)
+    if table.digest != rules_digest(args.rules):
+        print(f"Warning: {args.table} was built from different rules")
+    batches = [("random", random_poses(args.samples))]
+    if args.landmarks:
+        with np.load(args.landmarks) as data:
+            batches.append((args.landmarks, np.asarray(data["landmarks"], dtype=np.float32)))
+
+    failed = False
+    for name, poses in batches:
+        agreement, mismatches = verify(table, poses, rules)
+        print(f"{name}: {len(poses)} poses, {agreement * 100:.3f}% agree with the rules")
+        for (expected, actual), count in sorted(mismatches.items(), key=lambda item: -item[1]):
+            print(f"  rules {expected!r} but table {actual!r}: {count}")
+        failed |= bool(mismatches) and table.source == "rules"
+
+    sample = batches[0][1][:2000]
+    zeros = [0.0] * len(rules.baseline_names)
+    rule_us = _time_per_pose(lambda pose: rules.classify(rules.evaluate(pose, zeros), "block_type"), sample)
+    table_us = _time_per_pose(table.classify, sample)
+    print(f"Per pose: rules {rule_us:.1f} us, table {table_us:.1f} us")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
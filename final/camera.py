@@ -0,0 +1,479 @@
+import argparse
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# How to open a webcam. exposure=None leaves auto exposure on; a number
+# switches to manual exposure with that value (units depend on the driver).
+CameraConfig = namedtuple(
+    "CameraConfig",
+    ["index", "width", "height", "fps", "fourcc", "buffer_size", "exposure"],
+    defaults=[0, 640, 480, 30, "MJPG", 1, None],
+)
+
+# Modes tried by probe_camera() when none are given
+DEFAULT_PROBE_MODES = [
+    {"fourcc": "MJPG", "width": 640, "height": 480, "fps": 60},
+    {"fourcc": "MJPG", "width": 640, "height": 480, "fps": 30},
+    {"fourcc": "YUYV", "width": 640, "height": 480, "fps": 30},
+    {"fourcc": "MJPG", "width": 1280, "height": 720, "fps": 30},
+    {"fourcc": "YUYV", "width": 320, "height": 240, "fps": 30},
+]
+
+
+def decode_fourcc(value):
+    """Turn the number from CAP_PROP_FOURCC back into its four characters."""
+    value = int(value)
+    return "".join(chr((value >> (8 * i)) & 0xFF) for i in range(4))
+
+
+class CameraSource:
+    """
+    A webcam opened with an explicit pixel format, size, frame rate and a
+    one-frame driver buffer, so frames are not queued up inside the driver.
+    """
+
+    # A failed read may mean the device was unplugged, so reopening can help
+    reconnectable = True
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else CameraConfig()
+        self.cap = None
+        self.negotiated = {}
+
+    def open(self):
+        config = self.config
+        self.cap = cv2.VideoCapture(config.index)
+        if not self.cap.isOpened():
+            return False
+
+        # Pixel format has to be set before size and rate on most drivers
+        if config.fourcc:
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*config.fourcc))
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, config.width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config.height)
+        self.cap.set(cv2.CAP_PROP_FPS, config.fps)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, config.buffer_size)
+
+        if config.exposure is not None:
+            # V4L2 uses 0.25 for manual and 0.75 for auto, other backends 0 / 1
+            if not self.cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, 0.25):
+                self.cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, 0)
+            self.cap.set(cv2.CAP_PROP_EXPOSURE, config.exposure)
+
+        # What the driver actually agreed to
+        self.negotiated = {
+            "fourcc": decode_fourcc(self.cap.get(cv2.CAP_PROP_FOURCC)),
+            "width": int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "fps": self.cap.get(cv2.CAP_PROP_FPS),
+            "buffer_size": int(self.cap.get(cv2.CAP_PROP_BUFFERSIZE)),
+        }
+        return True
+
+    def is_opened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def read(self, image=None):
+        if self.cap is None:
+            return False, None
+        return self.cap.read(image)
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class VideoFileSource:
+    """
+    Plays a video file through the camera interface.
+
+    With realtime=True reads are paced to the file's frame rate like a real
+    camera, so a slow reader misses frames instead of slowing the clip down.
+    """
+
+    # A failed read is the end of the clip; reopening would replay it
+    reconnectable = False
+
+    def __init__(self, path, realtime=True, loop=False):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.cap = None
+        self.fps = 30.0
+        self.frame_count = 0
+        self.start_time = 0.0
+        self.frame_index = 0
+        self.frames_skipped = 0  # Frames that were already late and never delivered
+        self.negotiated = {}
+
+    def open(self):
+        self.cap = cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            return False
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.start_time = time.monotonic()
+        self.frame_index = 0
+        self.frames_skipped = 0
+        self.negotiated = {
+            "fourcc": decode_fourcc(self.cap.get(cv2.CAP_PROP_FOURCC)),
+            "width": int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "fps": self.fps,
+        }
+        return True
+
+    def is_opened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def frame_time(self, frame_index):
+        """Monotonic time at which frame_index is due, for realtime playback."""
+        return self.start_time + frame_index / self.fps
+
+    def read(self, image=None):
+        if self.cap is None:
+            return False, None
+
+        if self.realtime:
+            # Skip frames that are already late, then wait for the next one
+            due_index = int((time.monotonic() - self.start_time) * self.fps)
+            while self.frame_index < due_index:
+                if not self.cap.grab():
+                    break
+                self.frame_index += 1
+                self.frames_skipped += 1
+            delay = self.frame_time(self.frame_index) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        success, frame = self.cap.read(image)
+        if not success and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self.start_time = time.monotonic()
+            self.frame_index = 0
+            success, frame = self.cap.read(image)
+        if success:
+            self.frame_index += 1
+        return success, frame
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class SyntheticSource:
+    """
+    Generates frames at a fixed rate without any camera.
+
+    frame_fn(index, image) can draw into each frame; by default a bright
+    bar sweeps across a dark background so consecutive frames differ.
+    """
+
+    reconnectable = False
+
+    def __init__(self, width=640, height=480, fps=30, frame_fn=None, frame_limit=None):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frame_fn = frame_fn
+        self.frame_limit = frame_limit
+        self.opened = False
+        self.frame_index = 0
+        self.start_time = 0.0
+        self.negotiated = {}
+
+    def open(self):
+        self.opened = True
+        self.frame_index = 0
+        self.start_time = time.monotonic()
+        self.negotiated = {"fourcc": "SYNT", "width": self.width, "height": self.height, "fps": self.fps}
+        return True
+
+    def is_opened(self):
+        return self.opened
+
+    def read(self, image=None):
+        if not self.opened:
+            return False, None
+        if self.frame_limit is not None and self.frame_index >= self.frame_limit:
+            return False, None
+
+        delay = self.start_time + self.frame_index / self.fps - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        if image is None or image.shape != (self.height, self.width, 3):
+            image = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        if self.frame_fn is not None:
+            self.frame_fn(self.frame_index, image)
+        else:
+            image.fill(32)
+            bar = (self.frame_index * 8) % self.width
+            image[:, bar:bar + 16] = 224
+        self.frame_index += 1
+        return True, image
+
+    def release(self):
+        self.opened = False
+
+
+def measure_source(source, frames=90, warmup=10):
+    """
+    Read frames from an opened source and measure what it really delivers.
+
+    Returns delivered FPS and the mean, standard deviation (jitter) and
+    95th percentile of the interval between frames, in milliseconds.
+    """
+    for _ in range(warmup):
+        source.read()
+
+    stamps = []
+    failures = 0
+    image = None
+    for _ in range(frames):
+        success, frame = source.read(image)
+        if not success:
+            failures += 1
+            continue
+        image = frame
+        stamps.append(time.monotonic())
+
+    if len(stamps) < 2:
+        return {"delivered_fps": 0.0, "interval_ms": 0.0, "jitter_ms": 0.0, "p95_interval_ms": 0.0,
+                "failures": failures}
+    intervals = np.diff(stamps) * 1000.0
+    return {
+        "delivered_fps": (len(stamps) - 1) / (stamps[-1] - stamps[0]),
+        "interval_ms": float(intervals.mean()),
+        "jitter_ms": float(intervals.std()),
+        "p95_interval_ms": float(np.percentile(intervals, 95)),
+        "failures": failures,
+    }
+
+
+def probe_camera(index=0, modes=None, frames=90, exposure=None):
+    """Open the camera in each mode and report what the driver negotiated and delivered."""
+    results = []
+    for mode in modes or DEFAULT_PROBE_MODES:
+        config = CameraConfig(index=index, exposure=exposure, **mode)
+        source = CameraSource(config)
+        if not source.open():
+            results.append({"requested": dict(mode), "opened": False})
+            continue
+        try:
+            measured = measure_source(source, frames)
+        finally:
+            source.release()
+        results.append({"requested": dict(mode), "opened": True,
+                        "negotiated": source.negotiated, **measured})
+    return results
+
+
+class CaptureRecovery:
+    """
+    What a capture loop should do after failed reads.
+
+    "running" is the normal state. A failed read moves to "backoff": wait
+    before trying again, doubling the wait each time up to max_delay. Every
+    reopen_after failures in a row it moves to "reopening" instead, so a
+    webcam that was unplugged or reset is released and opened again. A good
+    frame puts it back in "running".
+    """
+
+    RUNNING = "running"
+    BACKOFF = "backoff"
+    REOPENING = "reopening"
+
+    def __init__(self, initial_delay=0.01, max_delay=1.0, reopen_after=5):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.reopen_after = reopen_after
+        self.state = self.RUNNING
+        self.failures = 0  # Failed reads in a row
+        self.reopens = 0
+
+    def read_failed(self, can_reopen=True):
+        """Record a failed read. Returns (state, seconds to wait before the next read)."""
+        self.failures += 1
+        delay = min(self.initial_delay * 2 ** min(self.failures - 1, 30), self.max_delay)
+        if can_reopen and self.failures % self.reopen_after == 0:
+            self.state = self.REOPENING
+            self.reopens += 1
+        else:
+            self.state = self.BACKOFF
+        return self.state, delay
+
+    def read_succeeded(self):
+        """Record a good frame. Returns True if it ends a run of failures."""
+        recovered = self.state != self.RUNNING
+        self.state = self.RUNNING
+        self.failures = 0
+        return recovered
+
+    def reset(self):
+        self.state = self.RUNNING
+        self.failures = 0
+
+
+class LatestFrameMailbox:
+    """
+    One-slot overwrite buffer between the capture and inference threads.
+
+    The capture thread always puts the newest frame in, replacing any frame
+    that has not been taken yet. The inference thread always takes the
+    freshest frame, so a slow inference never leaves it working through a
+    queue of old frames.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._frame = None
+        self._sequence = 0
+        self._capture_time = 0.0
+        self._closed = False
+
+        # Optional callable run after every put(), outside the lock, for a
+        # reader that serves several mailboxes instead of waiting on one
+        self.listener = None
+
+        # Counters
+        self.frames_put = 0
+        self.frames_taken = 0
+        self.frames_dropped = 0  # Overwritten before inference took them
+
+    def put(self, frame, sequence, capture_time):
+        """
+        Store a frame, replacing the previous one if it was never taken.
+        Returns the replaced frame (or None) so its buffer can be reused.
+        """
+        with self._condition:
+            dropped = self._frame
+            if dropped is not None:
+                self.frames_dropped += 1
+            self._frame = frame
+            self._sequence = sequence
+            self._capture_time = capture_time
+            self.frames_put += 1
+            self._condition.notify()
+        if self.listener is not None:
+            self.listener()
+        return dropped
+
+    def has_frame(self):
+        with self._condition:
+            return self._frame is not None
+
+    def take(self, timeout=None):
+        """
+        Wait for a frame and remove it from the mailbox.
+
+        Returns (frame, sequence, capture_time), or None on timeout or
+        after close().
+        """
+        with self._condition:
+            if self._frame is None and not self._closed:
+                self._condition.wait(timeout)
+            if self._frame is None:
+                return None
+            frame = self._frame
+            self._frame = None
+            self.frames_taken += 1
+            return frame, self._sequence, self._capture_time
+
+    def close(self):
+        """Wake up any waiting reader so its thread can exit."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def reopen(self):
+        with self._condition:
+            self._closed = False
+            self._frame = None
+
+
+class FramePool:
+    """
+    Reusable frame buffers for the capture thread.
+
+    The capture thread reads into a buffer from the pool, the mailbox hands
+    back any frame it overwrites, and the inference thread returns frames
+    when it is done. Three buffers cover the steady state (one being read,
+    one waiting, one in inference); 'allocations' only grows if that is not
+    enough or the frame size changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._free = []
+        self.allocations = 0
+
+    def acquire(self, shape):
+        """Return a free buffer of the given shape, allocating one only if needed."""
+        with self._lock:
+            while self._free:
+                buffer = self._free.pop()
+                if buffer.shape == shape:
+                    return buffer
+        self.allocations += 1
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, buffer):
+        if buffer is not None:
+            with self._lock:
+                self._free.append(buffer)
+
+
+class FrameAgeStats:
+    """Running statistics of how old frames are when inference picks them up."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_age = 0.0
+        self.max_age = 0.0
+        self.last_age = 0.0
+
+    def add(self, capture_time, now=None):
+        if now is None:
+            now = time.monotonic()
+        age = now - capture_time
+        self.count += 1
+        self.total_age += age
+        self.last_age = age
+        if age > self.max_age:
+            self.max_age = age
+        return age
+
+    @property
+    def mean_age(self):
+        return self.total_age / self.count if self.count else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure real frame rate and jitter for each camera mode.")
+    parser.add_argument("--index", type=int, default=0, help="camera index")
+    parser.add_argument("--frames", type=int, default=90, help="frames to time per mode")
+    parser.add_argument("--exposure", type=float, default=None, help="lock exposure to this value")
+    args = parser.parse_args()
+
+    for result in probe_camera(args.index, frames=args.frames, exposure=args.exposure):
+        requested = result["requested"]
+        label = f"{requested['fourcc']} {requested['width']}x{requested['height']}@{requested['fps']}"
+        if not result["opened"]:
+            print(f"{label}: could not open")
+            continue
+        got = result["negotiated"]
+        print(f"{label}: got {got['fourcc']} {got['width']}x{got['height']}@{got['fps']:.0f}, "
+              f"delivered {result['delivered_fps']:.1f} FPS, "
+              f"interval {result['interval_ms']:.1f} ms, jitter {result['jitter_ms']:.1f} ms, "
+              f"p95 {result['p95_interval_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,217 +1,892 @@
 import cv2
-import mediapipe as mp
 import numpy as np
 import time
 import threading
+from collections import namedtuple
 
-class PoseController:
-    def __init__(self, min_detection_confidence=0.5, min_tracking_confidence=0.5):
-        # Initialize MediaPipe Pose
-        self.mp_pose = mp.solutions.pose
-        self.mp_drawing = mp.solutions.drawing_utils
+from camera import (LatestFrameMailbox, FrameAgeStats, FramePool, CameraConfig, CameraSource,
+                    CaptureRecovery)
+from pose_backends import create_backend
+from landmarks import X, SHOULDERS, mirror_landmarks
+from pose_rules import DEFAULT_RULES_PATH, load_rules
+from roi import RoiCropper
+from history import LandmarkHistory
+from governor import QualityGovernor
+from latency import LatencyTracker
+from tracking import PoseTracker
+from filters import OneEuroFilter, KalmanPredictor, forecast
+from block_table import FEATURE_JOINTS, load_block_table
+from baseline import BASELINE_NAMES, BASELINE_JOINTS, BaselineEstimator
+from jump import JumpDetector, JumpIntentPredictor, GROUNDED, NO_INTENT
+from visibility import (FULL_BODY, HIPS_ONLY, UPPER_BODY, BodyModeTracker, visibility_mask,
+                        estimate_body_height)
+
+# One consistent view of the controller state, built from a single camera frame.
+# The camera thread publishes a new snapshot by swapping one reference, so the
+# game thread can read it without locks and never sees values from two frames.
+ControlSnapshot = namedtuple("ControlSnapshot", [
+    "sequence",        # Camera frame number this snapshot was built from
+    "capture_time",    # time.monotonic() when the frame was read
+    "inference_time",  # time.monotonic() when pose.process() finished
+    "move_x",          # Normalized x position (0 to 1)
+    "jump",
+    "jump_power",
+    "block_type",
+    "landmarks",       # (33, 4) float32 array of x, y, z, visibility (smoothed if enabled)
+    "motion_history",  # Recent (capture_time, move_x) samples, oldest first
+    "raw_landmarks",   # landmarks as the pose backend returned them
+    "kinematics",      # (33, 3, 3) position, velocity, acceleration at capture_time, if predicting
+    "jump_state",      # jump.JumpState: takeoff time between frames, height, expected peak
+    "jump_intent",     # jump.JumpIntent: a takeoff predicted from the squat before it
+    "body_mode",       # visibility.FULL_BODY, HIPS_ONLY or UPPER_BODY: how much of the player is in view
+])
+
+EMPTY_SNAPSHOT = ControlSnapshot(
+    sequence=0,
+    capture_time=0.0,
+    inference_time=0.0,
+    move_x=0.5,
+    jump=False,
+    jump_power=0,
+    block_type="None",
+    landmarks=None,
+    motion_history=(),
+    raw_landmarks=None,
+    kinematics=None,
+    jump_state=GROUNDED,
+    jump_intent=NO_INTENT,
+    body_mode=None,
+)
+
+# Poses that add to jump_power (the hand checks against hips and shoulders are
+# tracked but do not change the original 12 / 16 / 20 buckets)
+JUMP_POWER_POSES = ("HeadLowered", "KneesBent", "HandsBelowKnees")
+
+# Number of (time, x) samples kept for interpolation
+MOTION_HISTORY_LENGTH = 4
+
+
+def sample_motion(history, t, max_extrapolation=0.1):
+    """
+    Estimate move_x at time t from timestamped samples.
+
+    Between two samples the value is interpolated linearly. Past the newest
+    sample it is extrapolated from the last two, but never more than
+    max_extrapolation seconds ahead so a dropped frame cannot fling the
+    player across the court.
+    """
+    if not history:
+        return None
+    if len(history) == 1 or t <= history[0][0]:
+        return history[0][1]
+
+    for (t0, x0), (t1, x1) in zip(history, history[1:]):
+        if t <= t1:
+            break
+    else:
+        # Newer than everything we have, extrapolate from the last two samples
+        t = min(t, t1 + max_extrapolation)
 
+    if t1 <= t0:
+        return x1
+    x = x0 + (x1 - x0) * (t - t0) / (t1 - t0)
+    return min(1.0, max(0.0, x))
+
+class PlayerState:
+    """Baselines, pose history and the latest snapshot for one player."""
+
+    def __init__(self, pose_names, history_size=64, smoothing=False, prediction=False):
         # Baseline Parameters
         self.Baseline_FloorY = 0.1
         self.Baseline_Height = 0.1
         self.Baseline_KneeLevel = 0.1
+        self.baseline_set = False  # Clearing it starts calibration over
+        self.baseline = BaselineEstimator()
 
-        # Pose Dictionary
-        self.pose_dictionary = {
-            "HeadLowered": [],
-            "KneesBent": [],
-            "HandsBelowKnees": [],
-            "HandsBelowHips": [],
-            "HandsBelowShoulders": [],
-        }
+        # Recent landmarks and pose flags, queried by time rather than sample count
+        self.history = LandmarkHistory(pose_names, capacity=history_size)
+
+        # Latest published state, replaced as a whole by the inference thread
+        self.snapshot = EMPTY_SNAPSHOT
+
+        # Adaptive low-pass filter over all landmarks, if smoothing is on
+        self.filter = OneEuroFilter() if smoothing else None
+
+        # Kalman state used to forecast landmarks to render time, if prediction is on
+        self.predictor = KalmanPredictor() if prediction else None
+
+        # Takeoff and landing from hip and ankle speed
+        self.jump_detector = JumpDetector()
+
+        # Takeoff predicted from the countermovement, before the feet leave the floor
+        self.intent_predictor = JumpIntentPredictor()
+
+        # How much of the body is in view, which decides how jumps are detected
+        self.body_mode = BodyModeTracker()
+
+    def reset(self):
+        """Forget everything about the person, for a new camera or a new person. Inference thread only."""
+        self.baseline_set = False
+        self.baseline.reset()
+        self.history.clear()
+        self.snapshot = EMPTY_SNAPSHOT
+        if self.filter is not None:
+            self.filter.reset()
+        if self.predictor is not None:
+            self.predictor.reset()
+        self.jump_detector.reset()
+        self.intent_predictor.reset()
+        self.body_mode.reset()
+
+
+class PoseController:
+    def __init__(self, min_detection_confidence=0.5, min_tracking_confidence=0.5, backend="legacy",
+                 roi_mode=False, roi_size=256, history_size=64, rules_path=DEFAULT_RULES_PATH,
+                 camera_config=None, mirror="pixels", latency_budget_ms=None, backend_options=None,
+                 num_players=1, smoothing=False, classify_raw=False, prediction=False, max_prediction=0.15,
+                 jump_detection="velocity", min_visibility=0.5, block_classifier="rules"):
+        # Pose checks, compiled from the rule file into one evaluation kernel
+        self.rules = load_rules(rules_path)
+        self.pose_names = self.rules.group_names("poses")
+        self.jump_power_index = np.array([self.pose_names.index(key) for key in JUMP_POWER_POSES])
+        self.jump_rule = self.rules.rule_index["Jumping"]
+        # "velocity" uses JumpDetector; "rule" is the old ankles-above-knee-level check
+        self.jump_detection = jump_detection
+        # Landmarks less visible than this are out of view: rules that read them are skipped,
+        # and without the ankles jumps are detected from the hips
+        self.min_visibility = min_visibility
+        # "table" classifies blocks with the precomputed lookup table in block_table.npz
+        # (built from the rules if missing) instead of the rule kernel
+        self.block_table = None
+        if block_classifier == "table":
+            self.block_table = load_block_table(rules=self.rules, rules_path=rules_path)
+
+        # One state per player. With more than one player a single inference finds
+        # everyone in the frame and the tracker keeps each person on their own player.
+        if num_players > 1 and backend != "tasks":
+            raise ValueError("More than one player needs the 'tasks' backend")
+        if num_players > 1 and roi_mode:
+            raise ValueError("ROI mode follows a single pose and cannot be used with more than one player")
+        self.players = [PlayerState(self.pose_names, history_size, smoothing, prediction)
+                        for _ in range(num_players)]
+        # With smoothing on, move_x always uses the filtered landmarks. The pose
+        # rules do too, unless classify_raw asks for the unfiltered ones.
+        self.classify_raw = classify_raw
+        self.tracker = PoseTracker(slots=num_players) if num_players > 1 else None
 
         # Parameters for jump and block detection
-        self.update_interval = 0.1  # 100 ms # TOO SLOW, THE GAME WILL THINK YOUR ARE TELEPORTING!
-        self.last_update_time = time.time()
+        self.pose_window = 0.6  # Seconds a pose counts towards jump_power
         self.last_jump_time = 0
+
+        # Render-time interpolation for get_player_controls(t). move_x is rendered this many
+        # seconds behind t so it normally falls between two frames and extrapolation only
+        # covers dropped ones. None measures it: the capture-to-publish p50 plus one frame
+        # interval, starting from one frame at 30 FPS.
+        self.interpolation_delay = None
+        self.measured_interpolation_delay = 1.0 / 30.0
+        self.max_extrapolation = 0.1
+        self.frames_published = 0
+
+        # Render-time prediction, when prediction is on. Landmarks are forecast
+        # from their capture time to t plus display_lead, the measured time
+        # from reading controls to the display flip.
+        self.max_prediction = max_prediction
+        self.display_lead = 0.0
+        self.frames_displayed = 0
         
         # Camera and pose detection setup
-        self.pose = self.mp_pose.Pose(
-            min_detection_confidence=min_detection_confidence, 
-            min_tracking_confidence=min_tracking_confidence
-        )
+        # "legacy" runs Pose on the inference thread, "process" runs it in a child process,
+        # "tasks" runs the Tasks PoseLandmarker in LIVE_STREAM mode (backend_options
+        # can carry its model_path).
+        # The backend (and the MediaPipe import) is built by load_backend(), so
+        # constructing a controller is cheap and start_async() can do it off the main thread.
+        self.backend_name = backend
+        self.backend_options = {
+            'min_detection_confidence': min_detection_confidence,
+            'min_tracking_confidence': min_tracking_confidence,
+        }
+        if num_players > 1:
+            self.backend_options['num_poses'] = num_players
+        self.backend_options.update(backend_options or {})
+        self.backend = None
         
-        # Threading for camera capture
+        # Region-of-interest inference around the last known pose
+        self.roi = RoiCropper(crop_size=roi_size) if roi_mode else None
+        self.last_landmark_array = None
+        self.roi_frames = 0
+        self.full_frames = 0
+
+        # Optional governor that trades model and input size for latency
+        self.input_width = None  # Full frames wider than this are scaled down first
+        self.inference_latency = 0.0
+        self.governor = None
+        if latency_budget_ms is not None:
+            self.governor = QualityGovernor(budget_ms=latency_budget_ms)
+            self._apply_quality(self.governor.settings)
+
+        # Threading for camera capture and inference
+        self.camera_config = camera_config if camera_config is not None else CameraConfig()
         self.cap = None
-        self.landmarks = None
         self.running = False
-        self.baseline_set = False
-        self.player_x_position = 0.5  # Normalized x position (0 to 1)
-        
-        # Jump and block detection
-        self.is_jumping = False
-        self.block_type = "None"
-        self.jump_power = 0
-
-    def start_camera(self):
-        """Start camera capture in a separate thread."""
-        self.cap = cv2.VideoCapture(0)
+        self.frame_sequence = 0
+        self.mailbox = LatestFrameMailbox()
+        self.frame_age = FrameAgeStats()
+        self.frames_processed = 0
+
+        # Reused frame buffers. mirror is "pixels" (flip the image), "landmarks"
+        # (flip x after inference, no extra image copy) or None.
+        self.mirror = mirror
+        self.frame_pool = FramePool()
+        self.scratch_buffers = {}
+        self.scratch_allocations = 0
+
+        # Per-stage timestamps from capture to display, keyed by frame sequence
+        self.latency = LatencyTracker()
+
+        # Startup progress. ready is set once the model is warm and the first frame has been
+        # through inference.
+        self.ready = threading.Event()
+        self.status = "Not started"
+        self.startup_thread = None
+        self.camera_opened = False
+
+        # Capture recovery: read failures back off and a lost webcam is reopened
+        self.recovery = CaptureRecovery()
+        self.capture_wakeup = threading.Event()
+        self.pending_source = None
+        # Sequence number of the first frame from the current source, set by the capture
+        # thread; the inference thread resets the players when it reaches that frame
+        self.source_first_sequence = 0
+        self.players_reset_sequence = 0
+
+    # The first player's state, which is the only player outside two-player mode
+    @property
+    def snapshot(self):
+        return self.players[0].snapshot
+
+    @property
+    def history(self):
+        return self.players[0].history
+
+    @property
+    def baseline_set(self):
+        return self.players[0].baseline_set
+
+    @baseline_set.setter
+    def baseline_set(self, value):
+        # Clearing it recalibrates every player on their next detection
+        for player in self.players:
+            player.baseline_set = value
+
+    # Read-only views of the latest snapshot
+    @property
+    def landmarks(self):
+        return self.snapshot.landmarks
+
+    @property
+    def player_x_position(self):
+        return self.snapshot.move_x
+
+    @property
+    def is_jumping(self):
+        return self.snapshot.jump
+
+    @property
+    def block_type(self):
+        return self.snapshot.block_type
+
+    @property
+    def jump_power(self):
+        return self.snapshot.jump_power
+
+    def load_backend(self):
+        """Build the pose backend and run one warm-up inference, if not done yet."""
+        if self.backend is not None:
+            return
+        self.status = "Loading pose model"
+        options = dict(self.backend_options)
+        if self.governor is not None:
+            options['model_complexity'] = self.governor.settings["model_complexity"]
+        backend = create_backend(self.backend_name, **options)
+
+        # The first process() call allocates the graph's buffers and is much
+        # slower than the rest, so pay for it on a blank frame of camera size
+        self.status = "Warming up pose model"
+        config = self.camera_config
+        backend.process(self._scale_for_inference(np.zeros((config.height, config.width, 3), dtype=np.uint8)))
+        self.backend = backend
+
+    def start_camera(self, source=None, run_inference=True):
+        """
+        Start camera capture and pose inference in separate threads.
+
+        source can be any frame source from camera.py (a configured webcam,
+        a video file or synthetic frames). By default the webcam is opened
+        with camera_config. This blocks until the pose model is loaded; use
+        start_async() to keep the caller responsive.
+
+        With run_inference=False only the capture thread starts, and the
+        caller runs inference by calling process_next() from its own thread.
+        """
+        self.open_camera(source)
+        self.start_threads(run_inference)
+
+    def open_camera(self, source=None):
+        """
+        The first half of start_camera(): load the pose model and open the
+        source, without reading from it yet. Returns True if it opened.
+        """
+        self.load_backend()
+        return self._open_source(source)
+
+    def start_async(self, source=None):
+        """
+        Load the pose model and open the camera on a background thread.
+
+        Returns immediately. Watch status for progress; ready is set once
+        the first frame has been through inference.
+        """
+        self.startup_thread = threading.Thread(target=self._startup, args=(source,))
+        self.startup_thread.daemon = True
+        self.startup_thread.start()
+
+    def _startup(self, source):
+        """Background startup. Opening the camera and loading the model both block, so overlap them."""
+        opener = threading.Thread(target=self._open_source, args=(source,))
+        opener.daemon = True
+        opener.start()
+        try:
+            self.load_backend()
+        except Exception as error:
+            self.status = f"Pose model failed to load: {error}"
+            print(self.status)
+            return
+        self.status = "Opening camera"
+        opener.join()
+        if not self.camera_opened:
+            # Keep trying in the capture thread; ready is set if the camera shows up
+            self.status = "Could not open camera"
+        self.start_threads()
+
+    def _open_source(self, source=None):
+        self.cap = source if source is not None else CameraSource(self.camera_config)
+        self.camera_opened = self.cap.open()
+        if not self.camera_opened:
+            print("Could not open camera.")
+        return self.camera_opened
+
+    def start_threads(self, run_inference=True):
+        """The second half of start_camera(): start reading the opened source."""
         self.running = True
-        self.camera_thread = threading.Thread(target=self._camera_loop)
+        self.mailbox.reopen()
+        self.recovery.reset()
+        self.capture_wakeup.clear()
+        if self.camera_opened:
+            self.status = "Starting pose detection"
+
+        # Capture thread only reads frames so the webcam queue never backs up
+        self.camera_thread = threading.Thread(target=self._capture_loop)
         self.camera_thread.daemon = True
         self.camera_thread.start()
 
+        # Inference thread always works on the freshest frame
+        if run_inference:
+            self.inference_thread = threading.Thread(target=self._inference_loop)
+            self.inference_thread.daemon = True
+            self.inference_thread.start()
+
     def stop_camera(self):
-        """Stop camera capture."""
+        """Stop camera capture. Both threads are joined before the source is released."""
         self.running = False
-        if self.cap:
-            self.cap.release()
+        self.capture_wakeup.set()
+        self.mailbox.close()
         if hasattr(self, 'camera_thread'):
             self.camera_thread.join()
+        if hasattr(self, 'inference_thread'):
+            self.inference_thread.join()
+        # After the joins, so a frame still in inference cannot set it again
+        self.ready.clear()
+        if self.cap:
+            self.cap.release()
 
-    def _camera_loop(self):
-        """Internal method to continuously process camera frames."""
+    def close(self):
+        """Stop the camera and shut down the pose backend."""
+        if self.startup_thread is not None:
+            # Let a background startup finish so nothing starts after shutdown
+            self.startup_thread.join()
+        self.stop_camera()
+        if self.backend is not None:
+            self.backend.close()
+
+    def switch_camera(self, index):
+        """Move to another webcam index without stopping inference or rebuilding the pose model."""
+        self.camera_config = self.camera_config._replace(index=index)
+        self.switch_source(CameraSource(self.camera_config))
+
+    def switch_source(self, source):
+        """Hand the capture thread a new frame source. It is opened on that thread, between reads."""
+        self.pending_source = source
+        self.capture_wakeup.set()
+
+    def _apply_pending_source(self):
+        """Open the new source. Runs on the capture thread, so it leaves player state to inference."""
+        source, self.pending_source = self.pending_source, None
+        if self.cap:
+            self.cap.release()
+        self._open_source(source)
+        self.recovery.reset()
+        self.source_first_sequence = self.frame_sequence + 1
+
+    def _reset_players(self):
+        """Drop poses and baselines from the old camera. Runs on the inference thread."""
+        self.last_landmark_array = None
+        if self.tracker is not None:
+            self.tracker.clear()
+        for player in self.players:
+            player.reset()
+
+    def _reopen_source(self):
+        """Release and reopen the current source, for a device that dropped out."""
+        self.cap.release()
+        if self.cap.open():
+            print("Camera reopened.")
+            self.camera_opened = True
+
+    def _capture_loop(self):
+        """
+        Internal method to continuously read camera frames into the mailbox.
+
+        Failed reads back off instead of spinning, and a webcam that keeps
+        failing is reopened (see CaptureRecovery). None of this touches the
+        pose backend, so recovery costs only the time to reopen the device.
+        """
+        frame_shape = None
         while self.running:
-            success, image = self.cap.read()
+            if self.pending_source is not None:
+                self._apply_pending_source()
+                frame_shape = None
+
+            # Read straight into a pooled buffer once the frame size is known
+            buffer = self.frame_pool.acquire(frame_shape) if frame_shape else None
+            success, image = self.cap.read(buffer)
             if not success:
-                print("Ignoring empty camera frame.")
+                self.frame_pool.release(buffer)
+                state, delay = self.recovery.read_failed(getattr(self.cap, 'reconnectable', False))
+                if self.recovery.failures == 1:
+                    print("Ignoring empty camera frame.")
+                if state == CaptureRecovery.REOPENING:
+                    self._reopen_source()
+                # Wait, unless stop_camera() or switch_source() needs the thread sooner
+                self.capture_wakeup.wait(delay)
+                self.capture_wakeup.clear()
                 continue
+            if self.recovery.read_succeeded():
+                print("Camera frames are back.")
+                if not self.ready.is_set():
+                    self.status = "Starting pose detection"
+            if image is not buffer:
+                # The source allocated its own frame (first frame or a size change)
+                self.frame_pool.allocations += 1
+                frame_shape = image.shape
+
+            self.frame_sequence += 1
+            replaced = self.mailbox.put(image, self.frame_sequence, time.monotonic())
+            self.frame_pool.release(replaced)
 
-            # Process image
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    def _inference_loop(self):
+        """Internal method to run pose detection on the newest captured frame."""
+        while self.running:
+            self.process_next(timeout=0.5)
+
+    def process_next(self, timeout=None):
+        """
+        Run pose detection on the newest captured frame, waiting up to
+        timeout for one. Returns True if a frame was processed. Only one
+        thread at a time may call this for a given controller.
+        """
+        item = self.mailbox.take(timeout=timeout)
+        if item is None:
+            return False
+        image, sequence, capture_time = item
+        first_sequence = self.source_first_sequence
+        if first_sequence != self.players_reset_sequence and sequence >= first_sequence:
+            # First frame from a new source
+            self.players_reset_sequence = first_sequence
+            self._reset_players()
+        self.frame_age.add(capture_time)
+        self._process_frame(image, sequence, capture_time)
+        self.frame_pool.release(image)
+        self.frames_processed += 1
+        if not self.ready.is_set():
+            # Snapshots now come from real frames
+            self.status = "Ready"
+            self.ready.set()
+        return True
+
+    def _scratch_buffer(self, name, shape):
+        """A named conversion buffer, reallocated only when the frame size changes."""
+        buffer = self.scratch_buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+            self.scratch_buffers[name] = buffer
+            self.scratch_allocations += 1
+        return buffer
+
+    def _process_frame(self, image, sequence, capture_time):
+        """Run pose detection on one frame and publish the resulting snapshots."""
+        latency = self.latency
+        latency.mark(sequence, "capture", capture_time)
+
+        # Process image, writing into reused buffers
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self._scratch_buffer("rgb", image.shape))
+        if self.mirror == "pixels":
             # flip image for mirror effect
-            image_rgb = cv2.flip(image_rgb, 1)
-            results = self.pose.process(image_rgb)
-
-            if results.pose_landmarks:
-                landmarks = results.pose_landmarks.landmark
-
-                # Set baseline on first detection
-                if not self.baseline_set:
-                    self._get_baselines(landmarks)
-                    self.baseline_set = True
-
-                # Update pose states 
-                if time.time() - self.last_update_time >= self.update_interval:
-                    self._update_pose_dict(landmarks)
-                    self._detect_jump_and_block(landmarks)
-                    self._calculate_player_x(landmarks)
-                    self.last_update_time = time.time()
-
-                # Store landmarks for external access
-                self.landmarks = landmarks
-
-    def _get_baselines(self, landmarks):
-        """Calculate baseline measurements from landmarks."""
-        left_ankle = landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE]
-        right_ankle = landmarks[self.mp_pose.PoseLandmark.RIGHT_ANKLE]
-        self.Baseline_FloorY = (left_ankle.y + right_ankle.y) / 2
-
-        # Calculate nose to feet height difference
-        nose = landmarks[self.mp_pose.PoseLandmark.NOSE]
-        self.Baseline_Height = nose.y - self.Baseline_FloorY
-
-        # Calculate knee level
-        left_knee = landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE]
-        right_knee = landmarks[self.mp_pose.PoseLandmark.RIGHT_KNEE]
-        self.Baseline_KneeLevel = (left_knee.y + right_knee.y) / 2
-
-    def _detect_jump_and_block(self, landmarks):
-        """Detect jump and block type."""
-        # Jump detection
-        left_ankle = landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE]
-        right_ankle = landmarks[self.mp_pose.PoseLandmark.RIGHT_ANKLE]
-        avg_feet_y = (left_ankle.y + right_ankle.y) / 2
-        self.is_jumping = avg_feet_y < self.Baseline_KneeLevel
+            image_rgb = cv2.flip(image_rgb, 1, dst=self._scratch_buffer("mirrored", image.shape))
+        inference_start = time.monotonic()
+        latency.mark(sequence, "convert", inference_start)
+        if self.tracker is None:
+            landmark_array = self._run_inference(image_rgb)
+            detections = [landmark_array] if landmark_array is not None else []
+        else:
+            detections = self.backend.process_all(self._scale_for_inference(image_rgb))
+            self.full_frames += 1
+        inference_time = time.monotonic()
+        latency.mark(sequence, "inference", inference_time)
+        self.inference_latency = inference_time - inference_start
+        if self.governor is not None:
+            settings = self.governor.record(self.inference_latency, inference_time)
+            if settings is not None:
+                self._apply_quality(settings)
+
+        if self.mirror == "landmarks":
+            # Same result as flipping the pixels, without touching the image
+            detections = [mirror_landmarks(landmarks) for landmarks in detections]
+        if self.tracker is not None:
+            # Keep each person on the same player from frame to frame. A player
+            # whose person left, or whose slot went to someone new, starts over.
+            assigned, changed = self.tracker.assign(detections)
+            for slot in changed:
+                self.players[slot].reset()
+        else:
+            assigned = detections or [None]
+
+        updates = []
+        for player, landmarks in zip(self.players, assigned):
+            if landmarks is not None:
+                updates.append((player, self._update_player(player, landmarks, sequence, capture_time,
+                                                            inference_time)))
+        if not updates:
+            latency.discard(sequence)
+            return
+        latency.mark(sequence, "classify")
+
+        # Publish everything derived from this frame, one swap per player
+        for player, snapshot in updates:
+            player.snapshot = snapshot
+        latency.mark(sequence, "publish")
+        self.frames_published += 1
+        if self.frames_published % 30 == 0:
+            self._measure_interpolation_delay(updates[0][1].motion_history)
+
+    def _measure_interpolation_delay(self, motion_history):
+        """Capture-to-publish p50 plus the spacing of the newest motion samples."""
+        pipeline = self.latency.percentiles("pipeline")["p50"]
+        if pipeline is None or len(motion_history) < 2:
+            return
+        interval = (motion_history[-1][0] - motion_history[0][0]) / (len(motion_history) - 1)
+        self.measured_interpolation_delay = pipeline / 1000.0 + interval
+
+    def _update_player(self, player, raw_landmarks, sequence, capture_time, inference_time):
+        """Run the pose rules for one player's landmarks and return their new snapshot."""
+        if player.filter is not None:
+            landmarks = player.filter.filter(raw_landmarks, capture_time)
+        else:
+            landmarks = raw_landmarks
+        rule_landmarks = raw_landmarks if self.classify_raw else landmarks
+
+        visible = visibility_mask(rule_landmarks, self.min_visibility)
+        body_mode = player.body_mode.update(visible, capture_time)
+
+        # Baselines come from the first detection, then from every stretch of standing
+        # still, as long as the nose, knees and ankles are in view
+        if not player.baseline_set:
+            player.baseline.reset()
+            player.baseline_set = True
+        if visible[BASELINE_JOINTS].all():
+            baselines = player.baseline.update(capture_time, rule_landmarks)
+            if baselines is not None:
+                self._set_baselines(player, baselines)
+
+        previous = player.snapshot
+        move_x = self._calculate_player_x(landmarks)
+        motion_history = (previous.motion_history + ((capture_time, move_x),))[-MOTION_HISTORY_LENGTH:]
+
+        # Evaluate every rule at once, then update pose states.
+        # Windows are measured in seconds, so this runs on every frame.
+        rule_results = self._evaluate_rules(player, rule_landmarks, visible)
+        player.history.append(capture_time, rule_landmarks, self.rules.select(rule_results, "poses"))
+        body_height = self._body_height(player, rule_landmarks)
+        jump_state = self._detect_jump(player, rule_results, capture_time, body_mode, body_height)
+        if body_mode == UPPER_BODY:
+            player.intent_predictor.reset()
+            jump_intent = NO_INTENT
+        else:
+            jump_intent = player.intent_predictor.update(player.history, body_height, jump_state)
+        block_type, jump_power = self._detect_block_and_power(player, rule_landmarks, visible, rule_results)
+        # The Kalman filter smooths on its own; feeding it One Euro output would add that lag too
+        kinematics = player.predictor.update(raw_landmarks, capture_time) if player.predictor is not None else None
+
+        return ControlSnapshot(
+            sequence=sequence,
+            capture_time=capture_time,
+            inference_time=inference_time,
+            move_x=move_x,
+            jump=jump_state.airborne,
+            jump_power=jump_power,
+            block_type=block_type,
+            landmarks=landmarks,
+            motion_history=motion_history,
+            raw_landmarks=raw_landmarks,
+            kinematics=kinematics,
+            jump_state=jump_state,
+            jump_intent=jump_intent,
+            body_mode=body_mode,
+        )
+
+    def _run_inference(self, image_rgb):
+        """Run the pose backend, on a crop around the last pose when ROI mode is on."""
+        if self.roi is not None:
+            box = self.roi.compute_box(self.last_landmark_array)
+            if box is not None:
+                canvas, region = self.roi.crop(image_rgb, box)
+                landmark_array = self.backend.process(canvas)
+                if landmark_array is not None:
+                    self.roi_frames += 1
+                    self.last_landmark_array = self.roi.to_full_frame(landmark_array, region)
+                    return self.last_landmark_array
+
+        # Tracking lost or ROI disabled, use the whole frame
+        self.full_frames += 1
+        self.last_landmark_array = self.backend.process(self._scale_for_inference(image_rgb))
+        return self.last_landmark_array
+
+    def _scale_for_inference(self, image_rgb):
+        """Shrink a full frame to input_width. Landmarks are normalized, so nothing maps back."""
+        height, width = image_rgb.shape[:2]
+        if self.input_width is None or width <= self.input_width:
+            return image_rgb
+        scaled_shape = (height * self.input_width // width, self.input_width, 3)
+        return cv2.resize(image_rgb, (scaled_shape[1], scaled_shape[0]),
+                          dst=self._scratch_buffer("scaled", scaled_shape), interpolation=cv2.INTER_AREA)
+
+    def _apply_quality(self, settings):
+        """Switch model complexity, input size and ROI crop size. Runs on the inference thread."""
+        if self.backend is not None:  # Otherwise load_backend() picks the tier's model
+            self.backend.set_model_complexity(settings["model_complexity"])
+        self.input_width = settings["input_width"]
+        if self.roi is not None:
+            self.roi.set_crop_size(settings["roi_size"])
+
+    def _set_baselines(self, player, values):
+        """Copy the estimator's baselines (in BASELINE_NAMES order) onto the player."""
+        for name, value in zip(BASELINE_NAMES, values):
+            setattr(player, "Baseline_" + name, float(value))
 
+    def _baselines(self, player):
+        """Baselines in the order the rule file lists them."""
+        return [getattr(player, "Baseline_" + name) for name in self.rules.baseline_names]
+
+    def _evaluate_rules(self, player, landmarks, visible):
+        """Evaluate the pose rules, skipping those that read a hidden landmark or a missing baseline."""
+        return self.rules.evaluate(landmarks, self._baselines(player), visible,
+                                   baselines_valid=player.baseline.values is not None)
+
+    def _body_height(self, player, landmarks):
+        """Nose-to-floor height: the baseline once there is one, otherwise guessed from the torso."""
+        if player.baseline.values is not None:
+            return player.Baseline_Height
+        return estimate_body_height(landmarks)
+
+    def _detect_jump(self, player, rule_results, capture_time, body_mode, body_height):
+        """Return the player's JumpState after this frame."""
+        previous = player.snapshot.jump_state
+        if body_mode == UPPER_BODY:
+            # Nothing below the waist to jump with
+            return GROUNDED._replace(takeoff_time=previous.takeoff_time)
+        if self.jump_detection == "velocity" or body_mode == HIPS_ONLY:
+            return player.jump_detector.update(player.history, player.Baseline_FloorY, body_height,
+                                               lower_body=body_mode == FULL_BODY)
+
+        # Rule-based: takeoff is the first frame the rule fires
+        airborne = bool(rule_results[self.jump_rule])
+        takeoff_time = capture_time if airborne and not previous.airborne else previous.takeoff_time
+        return GROUNDED._replace(airborne=airborne, takeoff_time=takeoff_time)
+
+    def _classify_block(self, player, landmarks, visible, rule_results=None):
+        """
+        Block type from the lookup table when it is on and the arms and nose
+        are in view, otherwise from the rules (evaluated here if not given),
+        which give the default once they reach a class that is out of view.
+        """
+        if self.block_table is not None and visible[FEATURE_JOINTS].all():
+            return self.block_table.classify(landmarks)
+        if rule_results is None:
+            rule_results = self._evaluate_rules(player, landmarks, visible)
+        usable = self.rules.usable(visible, player.baseline.values is not None)
+        return self.rules.classify(rule_results, "block_type", usable)
+
+    def _detect_block_and_power(self, player, landmarks, visible, rule_results):
+        """Detect block type and jump power. Returns (block_type, jump_power)."""
         # Block type detection
-        self.block_type = self._get_block_type(landmarks)
+        block_type = self._classify_block(player, landmarks, visible, rule_results)
 
         # Jump power calculation
-        jump_value = sum(any(self.pose_dictionary[key]) for key in self.pose_dictionary)
+        seen = player.history.poses_within(self.pose_window)
+        jump_value = int(seen[self.jump_power_index].sum())
         if jump_value == 3:
-            self.jump_power = 20
+            jump_power = 20
         elif jump_value >= 1:
-            self.jump_power = 16
+            jump_power = 16
         else:
-            self.jump_power = 12
+            jump_power = 12
+
+        return block_type, jump_power
 
     def _calculate_player_x(self, landmarks):
         """Calculate normalized X position of player."""
-        left_shoulder = landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER]
-        right_shoulder = landmarks[self.mp_pose.PoseLandmark.RIGHT_SHOULDER]
-        
         # Normalize x position between 0 and 1
-        self.player_x_position = (left_shoulder.x + right_shoulder.x) / 2
-
-    def _get_block_type(self, landmarks):
-        """Determine block type based on hand and nose positions."""
-        nose = landmarks[self.mp_pose.PoseLandmark.NOSE]
-        left_hand = landmarks[self.mp_pose.PoseLandmark.LEFT_WRIST]
-        right_hand = landmarks[self.mp_pose.PoseLandmark.RIGHT_WRIST]
-        left_elbow = landmarks[self.mp_pose.PoseLandmark.LEFT_ELBOW]
-        right_elbow = landmarks[self.mp_pose.PoseLandmark.RIGHT_ELBOW]
-        left_shoulder = landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER]
-        right_shoulder = landmarks[self.mp_pose.PoseLandmark.RIGHT_SHOULDER]
-
-        # Check elbow position relative to shoulders
-        if left_elbow.y < left_shoulder.y and right_elbow.y < right_shoulder.y:
-            if left_hand.x < nose.x and right_hand.x < nose.x:
-                return "Left"
-            elif left_hand.x > nose.x and right_hand.x > nose.x:
-                return "Right"
-            elif self._close_enough(left_hand, right_hand, 0.2):
-                return "Middle"
-            else:
-                return "Split"
-        return "None"
-
-    def _close_enough(self, point1, point2, threshold=0.1):
-        """Check if two points are within a certain distance threshold."""
-        distance = np.sqrt((point1.x - point2.x) ** 2 + (point1.y - point2.y) ** 2)
-        return distance < threshold
-
-    def _update_pose_dict(self, landmarks):
-        """Update pose dictionary with current state checks."""
-        # Similar to the original UpdatePoseDict function
-        self.pose_dictionary["HeadLowered"].append(
-            landmarks[self.mp_pose.PoseLandmark.NOSE].y > 
-            self.Baseline_FloorY + (self.Baseline_Height * 0.5)
-        )
-        self.pose_dictionary["KneesBent"].append(
-            (landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE].y + 
-             landmarks[self.mp_pose.PoseLandmark.RIGHT_KNEE].y) / 2 > 
-            self.Baseline_FloorY + (self.Baseline_KneeLevel * 0.7)
-        )
-        self.pose_dictionary["HandsBelowKnees"].append(
-            (landmarks[self.mp_pose.PoseLandmark.LEFT_WRIST].y < 
-             landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE].y) and
-            (landmarks[self.mp_pose.PoseLandmark.RIGHT_WRIST].y < 
-             landmarks[self.mp_pose.PoseLandmark.RIGHT_KNEE].y)
-        )
-        # TOO MANY POSES TO TRACK SLOWS DOWN THE GAME
-        # self.pose_dictionary["HandsBelowHips"].append(
-        #     (landmarks[self.mp_pose.PoseLandmark.LEFT_WRIST].y < 
-        #      landmarks[self.mp_pose.PoseLandmark.LEFT_HIP].y) and
-        #     (landmarks[self.mp_pose.PoseLandmark.RIGHT_WRIST].y < 
-        #      landmarks[self.mp_pose.PoseLandmark.RIGHT_HIP].y)
-        # )
-        # self.pose_dictionary["HandsBelowShoulders"].append(
-        #     (landmarks[self.mp_pose.PoseLandmark.LEFT_WRIST].y < 
-        #      landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER].y) and
-        #     (landmarks[self.mp_pose.PoseLandmark.RIGHT_WRIST].y < 
-        #      landmarks[self.mp_pose.PoseLandmark.RIGHT_SHOULDER].y)
-        # )
-
-        # Add other pose checks as needed, maintaining a list of 5 recent states
-        for key in self.pose_dictionary:
-            if len(self.pose_dictionary[key]) > 6:  # Too many slows the game down!
-                self.pose_dictionary[key].pop(0)
-
-    def get_player_controls(self):
+        return float(landmarks[SHOULDERS, X].mean())
+
+    @property
+    def pose_dictionary(self):
+        """Recent states of each pose within pose_window, oldest first."""
+        return {key: self.history.pose_flags(key, self.pose_window).tolist() for key in self.pose_names}
+
+    def get_stats(self):
+        """
+        Return counters that show how far behind real time inference runs.
+
+        'frames_dropped' counts frames the capture thread replaced before
+        inference got to them. The 'frame_age' values are the time between
+        reading a frame and inference starting on it, in seconds.
+        'frame_buffers_allocated' stops growing once the frame pool has
+        warmed up; if it keeps climbing, something is allocating per frame.
+        'body_mode' says how much of player 0 is in view, and so how jumps
+        are detected. 'quality_switches' lists every quality tier change the
+        governor made, with its reason and the latencies behind it.
+        'baselines_calibrated' turns true once every player has stood still
+        long enough to calibrate; 'baseline_recalibrations' counts baselines
+        replaced because the camera or the player's distance changed.
+        """
+        snapshot = self.snapshot
+        return {
+            'frames_captured': self.mailbox.frames_put,
+            'frames_processed': self.frames_processed,
+            'frames_dropped': self.mailbox.frames_dropped,
+            'frame_buffers_allocated': self.frame_pool.allocations + self.scratch_allocations,
+            'roi_frames': self.roi_frames,
+            'full_frames': self.full_frames,
+            'inference_latency': self.inference_latency,
+            'quality_tier': self.governor.tier if self.governor is not None else None,
+            'quality_switches': list(self.governor.switch_log) if self.governor is not None else [],
+            'frame_age_last': self.frame_age.last_age,
+            'frame_age_mean': self.frame_age.mean_age,
+            'frame_age_max': self.frame_age.max_age,
+            'snapshot_age': time.monotonic() - snapshot.capture_time if snapshot.sequence else 0.0,
+            'status': self.status,
+            'capture_state': self.recovery.state,
+            'camera_reopens': self.recovery.reopens,
+            'body_mode': snapshot.body_mode,
+            'baselines_calibrated': all(player.baseline.calibrated for player in self.players),
+            'baseline_recalibrations': sum(player.baseline.recalibrations for player in self.players),
+        }
+
+    def frame_displayed(self, sequence):
+        """Call right after pygame.display.flip() with the sequence the frame was drawn from."""
+        self.latency.mark(sequence, "flip")
+        self.frames_displayed += 1
+        if self.frames_displayed % 30 == 0:
+            consume_to_flip = self.latency.percentiles("flip")["p50"]
+            if consume_to_flip is not None:
+                self.display_lead = consume_to_flip / 1000.0
+
+    def get_latency_report(self):
+        """
+        Rolling p50 / p95 / p99 in milliseconds for each pipeline stage
+        (capture, convert, inference, classify, publish, consume, flip),
+        for 'pipeline' (capture to snapshot published), 'pose_age'
+        (capture to game consumption) and 'end_to_end' (capture to display flip).
+        """
+        return self.latency.report()
+
+    def get_snapshot(self, player=0):
+        """Return the latest ControlSnapshot for a player. Safe to call from any thread."""
+        return self.players[player].snapshot
+
+    def get_predicted_landmarks(self, t, player=0):
+        """
+        Landmarks forecast to render time t (time.monotonic()) plus display_lead,
+        or None if prediction is off or no pose has been seen.
+        """
+        return self._predict(self.players[player].snapshot, t)
+
+    def _predict(self, snapshot, t):
+        if snapshot.kinematics is None:
+            return None
+        horizon = min(max(t + self.display_lead - snapshot.capture_time, 0.0), self.max_prediction)
+        return forecast(snapshot.kinematics, snapshot.landmarks, horizon)
+
+    def get_player_controls(self, t=None, player=0):
         """
         Return a dictionary of player controls based on pose detection.
         
         This method can be called by the game loop to determine 
-        player movement and actions.
+        player movement and actions. All values come from the same
+        snapshot, and 'sequence' lets the caller spot a frame it has
+        already seen.
+
+        Pass the game's render time t (time.monotonic()) to get move_x
+        interpolated or extrapolated to that moment, so the player moves
+        smoothly even though inference runs slower than the game.
+        Jump and block states are discrete and always come from the
+        newest frame.
+
+        'jump_imminent' comes on during the squat before a jump, with
+        'expected_takeoff_time' saying when the feet should leave the floor,
+        so the game can start the jump before takeoff is actually seen.
+
+        With prediction on, move_x and block_type instead come from the
+        landmarks forecast to the moment this frame reaches the screen, so
+        the on-screen player keeps time with the real one.
+
+        In two-player mode, player picks whose controls to return.
         """
+        state = self.players[player]
+        snapshot = state.snapshot  # Read the reference once
+        self.latency.mark(snapshot.sequence, "consume")
+        move_x = snapshot.move_x
+        block_type = snapshot.block_type
+        predicted = self._predict(snapshot, t) if t is not None else None
+        if predicted is not None:
+            move_x = min(1.0, max(0.0, self._calculate_player_x(predicted)))
+            block_type = self._classify_block(state, predicted, visibility_mask(predicted, self.min_visibility))
+        elif t is not None and snapshot.motion_history:
+            delay = self.interpolation_delay
+            if delay is None:
+                delay = self.measured_interpolation_delay
+            move_x = sample_motion(snapshot.motion_history, t - delay, self.max_extrapolation)
         return {
-            'move_x': self.player_x_position,  # Normalized x position
-            'jump': self.is_jumping,
-            'jump_power': self.jump_power,
-            'block_type': self.block_type
-        }
\ No newline at end of file
+            'move_x': move_x,  # Normalized x position
+            'jump': snapshot.jump,
+            'jump_power': snapshot.jump_power,
+            'takeoff_time': snapshot.jump_state.takeoff_time,  # Between frames, time.monotonic()
+            'jump_height': snapshot.jump_state.height,  # Body heights above the floor
+            'jump_peak': snapshot.jump_state.peak_height,  # Expected peak of this jump
+            'jump_imminent': snapshot.jump_intent.imminent,
+            'jump_confidence': snapshot.jump_intent.confidence,
+            'expected_takeoff_time': snapshot.jump_intent.expected_takeoff_time,  # time.monotonic()
+            'body_mode': snapshot.body_mode,  # "full", "hips" (jumps from the hips) or "upper"
+            'block_type': block_type,
+            'sequence': snapshot.sequence,
+            'capture_time': snapshot.capture_time,
+        }
@@ -0,0 +1,181 @@
+import numpy as np
+
+from landmarks import LANDMARK_COUNT, LANDMARK_INDEX, VISIBILITY
+
+# One Euro parameters per landmark, by name. min_cutoff (Hz) sets how hard a
+# still joint is smoothed; beta sets how quickly the cutoff opens up as the
+# joint moves, so fast moves lag less. Hands and arms drive the blocks and
+# move fastest; the face and hips mostly need jitter removed.
+DEFAULT_MIN_CUTOFF = 1.0
+DEFAULT_BETA = 3.0
+JOINT_FILTER_PARAMS = {
+    "NOSE": (0.8, 2.0),
+    "LEFT_HIP": (0.8, 2.0), "RIGHT_HIP": (0.8, 2.0),
+    "LEFT_ELBOW": (1.5, 5.0), "RIGHT_ELBOW": (1.5, 5.0),
+    "LEFT_WRIST": (1.5, 5.0), "RIGHT_WRIST": (1.5, 5.0),
+    "LEFT_PINKY": (1.5, 5.0), "RIGHT_PINKY": (1.5, 5.0),
+    "LEFT_INDEX": (1.5, 5.0), "RIGHT_INDEX": (1.5, 5.0),
+    "LEFT_THUMB": (1.5, 5.0), "RIGHT_THUMB": (1.5, 5.0),
+}
+
+
+def _alpha(cutoff, dt):
+    """Smoothing factor of a first-order low-pass filter with this cutoff."""
+    tau = 1.0 / (2.0 * np.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroFilter:
+    """
+    One Euro filter over a whole (33, 4) landmark array at once.
+
+    x, y and z of every joint are filtered together with array operations,
+    each joint with its own min_cutoff and beta. Visibility passes through
+    unfiltered. A gap longer than reset_after seconds (the player left the
+    frame) starts the filter over instead of gliding from the old pose.
+    """
+
+    def __init__(self, joint_params=None, d_cutoff=1.0, reset_after=0.5):
+        params = dict(JOINT_FILTER_PARAMS)
+        params.update(joint_params or {})
+        self.min_cutoff = np.full((LANDMARK_COUNT, 1), DEFAULT_MIN_CUTOFF)
+        self.beta = np.full((LANDMARK_COUNT, 1), DEFAULT_BETA)
+        for name, (min_cutoff, beta) in params.items():
+            self.min_cutoff[LANDMARK_INDEX[name]] = min_cutoff
+            self.beta[LANDMARK_INDEX[name]] = beta
+        self.d_cutoff = d_cutoff
+        self.reset_after = reset_after
+
+        self.last_time = None
+        self.position = None  # Filtered x, y, z
+        self.velocity = None  # Filtered speed of x, y, z per second
+
+    def reset(self):
+        self.last_time = None
+
+    def filter(self, landmarks, t):
+        """Return a new filtered copy of landmarks for a frame captured at time t."""
+        raw = landmarks[:, :VISIBILITY].astype(np.float64)
+        dt = t - self.last_time if self.last_time is not None else None
+        if dt is None or dt > self.reset_after:
+            self.position = raw
+            self.velocity = np.zeros_like(raw)
+        elif dt > 0:
+            velocity = (raw - self.position) / dt
+            self.velocity += _alpha(self.d_cutoff, dt) * (velocity - self.velocity)
+            cutoff = self.min_cutoff + self.beta * np.abs(self.velocity)
+            self.position = self.position + _alpha(cutoff, dt) * (raw - self.position)
+        self.last_time = t
+
+        filtered = landmarks.copy()
+        filtered[:, :VISIBILITY] = self.position
+        return filtered
+
+
+# Kalman noise per landmark, by name: (process noise, measurement noise).
+# Process noise is the white-jerk intensity of the constant-acceleration
+# model; joints that change speed quickly need more of it. Measurement
+# noise is the variance of MediaPipe's jitter in normalized units.
+DEFAULT_PROCESS_NOISE = 300.0
+DEFAULT_MEASUREMENT_NOISE = 2.5e-5
+JOINT_KALMAN_PARAMS = {
+    "LEFT_ELBOW": (600.0, 4e-5), "RIGHT_ELBOW": (600.0, 4e-5),
+    "LEFT_WRIST": (1000.0, 6e-5), "RIGHT_WRIST": (1000.0, 6e-5),
+    "LEFT_PINKY": (1000.0, 1e-4), "RIGHT_PINKY": (1000.0, 1e-4),
+    "LEFT_INDEX": (1000.0, 1e-4), "RIGHT_INDEX": (1000.0, 1e-4),
+    "LEFT_THUMB": (1000.0, 1e-4), "RIGHT_THUMB": (1000.0, 1e-4),
+}
+
+
+def _transition(dt):
+    return np.array([[1.0, dt, 0.5 * dt * dt],
+                     [0.0, 1.0, dt],
+                     [0.0, 0.0, 1.0]])
+
+
+def _process_covariance(dt):
+    """Covariance added per unit of jerk noise over dt, for position, velocity and acceleration."""
+    return np.array([[dt ** 5 / 20, dt ** 4 / 8, dt ** 3 / 6],
+                     [dt ** 4 / 8, dt ** 3 / 3, dt ** 2 / 2],
+                     [dt ** 3 / 6, dt ** 2 / 2, dt]])
+
+
+def forecast(kinematics, landmarks, dt):
+    """
+    Extrapolate landmarks dt seconds ahead from a (33, 3, 3) kinematic state
+    of position, velocity and acceleration per joint and axis. Visibility is
+    copied from landmarks.
+
+    Acceleration is only used to slow a moving joint down, and never past
+    the point where it would stop. The acceleration estimate lags the real
+    one, so using it to speed a joint up overshoots at the end of every
+    block or step; holding velocity does not.
+    """
+    position, velocity, acceleration = kinematics[:, 0], kinematics[:, 1], kinematics[:, 2]
+    braking = velocity * acceleration < 0
+    safe_acceleration = np.where(braking, acceleration, 1.0)
+    horizon = np.where(braking, np.minimum(dt, -velocity / safe_acceleration), dt)
+    predicted = landmarks.copy()
+    predicted[:, :VISIBILITY] = (position + velocity * horizon
+                                 + np.where(braking, 0.5 * acceleration * horizon * horizon, 0.0))
+    return predicted
+
+
+class KalmanPredictor:
+    """
+    Constant-acceleration Kalman filter for all 33 landmarks at once.
+
+    Every joint has a position, velocity and acceleration state for x, y and
+    z. The three axes of a joint share one covariance, so the whole update
+    is a handful of batched (33, 3, 3) matrix operations. update() returns
+    the state at the frame's capture time; forecast() extrapolates it to
+    when the game will show it.
+    """
+
+    def __init__(self, joint_params=None, reset_after=0.5, initial_variance=1.0):
+        params = dict(JOINT_KALMAN_PARAMS)
+        params.update(joint_params or {})
+        self.process_noise = np.full(LANDMARK_COUNT, DEFAULT_PROCESS_NOISE)
+        self.measurement_noise = np.full(LANDMARK_COUNT, DEFAULT_MEASUREMENT_NOISE)
+        for name, (process_noise, measurement_noise) in params.items():
+            self.process_noise[LANDMARK_INDEX[name]] = process_noise
+            self.measurement_noise[LANDMARK_INDEX[name]] = measurement_noise
+        self.reset_after = reset_after
+        self.initial_variance = initial_variance
+
+        self.last_time = None
+        self.state = None       # (33, 3, 3): joint, [position, velocity, acceleration], axis
+        self.covariance = None  # (33, 3, 3): joint, state, state
+
+    def reset(self):
+        self.last_time = None
+
+    def _start(self, measured):
+        self.state = np.zeros((LANDMARK_COUNT, 3, 3))
+        self.state[:, 0] = measured
+        self.covariance = np.zeros((LANDMARK_COUNT, 3, 3))
+        self.covariance[:, 0, 0] = self.measurement_noise
+        self.covariance[:, 1, 1] = self.initial_variance
+        self.covariance[:, 2, 2] = self.initial_variance
+
+    def update(self, landmarks, t):
+        """Add a measurement captured at time t. Returns a copy of the (33, 3, 3) state."""
+        measured = landmarks[:, :VISIBILITY].astype(np.float64)
+        dt = t - self.last_time if self.last_time is not None else None
+        if dt is None or dt > self.reset_after:
+            self._start(measured)
+        elif dt > 0:
+            # Predict to time t
+            transition = _transition(dt)
+            self.state = np.matmul(transition, self.state)
+            self.covariance = (np.matmul(np.matmul(transition, self.covariance), transition.T)
+                               + self.process_noise[:, None, None] * _process_covariance(dt))
+
+            # Correct with the measured positions
+            innovation_variance = self.covariance[:, 0, 0] + self.measurement_noise
+            gain = self.covariance[:, :, 0] / innovation_variance[:, None]        # (33, 3)
+            innovation = measured - self.state[:, 0]                               # (33, axes)
+            self.state += gain[:, :, None] * innovation[:, None, :]
+            self.covariance -= gain[:, :, None] * self.covariance[:, None, 0, :]
+        self.last_time = t
+        return self.state.copy()
@@ -1,3 +1,4 @@
+import argparse
 import pygame
 import sys
 import time
@@ -20,6 +21,7 @@ RECT_HEIGHT = 20
 SPEED = 5
 GRAVITY = 0.3
 JUMP_VELOCITY = -5
+PREARM_CONFIDENCE = 0.5  # Jump intent needed to start a jump before takeoff is seen
 
 # Colors
 GRAY = (232, 230, 223)
@@ -30,57 +32,36 @@ BLUE = (0, 0, 255)
 GREEN = (0, 255, 0)
 BLACK = (0, 0, 0)
 
-# Load Player Images
-player_images = {
-    "B_Idle": pygame.image.load("B_Idle.png"),
-    "B_Bump": pygame.image.load("B_Bump.png"),
-    "B_KneesBent": pygame.image.load("B_KneesBent.png"),
-    "B_LeftBlock": pygame.image.load("B_LeftBlock.png"),
-    "B_RightBlock": pygame.image.load("B_RightBlock.png"),
-    "B_MiddleBlock": pygame.image.load("B_MiddleBlock.png"),
-    "B_SplitBlock": pygame.image.load("B_SplitBlock.png"),
-}
-
-opponent_images = {
-    "S_Idle" : pygame.image.load("S_Idle.png"),
-    "S_Bump" : pygame.image.load("S_Bump.png"),
-    "S_KneesBent" : pygame.image.load("S_KneesBent.png"),
-    "S_LeftPrimed" : pygame.image.load("S_LeftPrimed.png"),
-    "S_LeftSpike" : pygame.image.load("S_LeftSpike.png"),
-    "S_RightPrimed" : pygame.image.load("S_RightPrimed.png"),
-    "S_RightSpike" : pygame.image.load("S_RightSpike.png"),
-}
-
-volleyball_bg_images = {
-    "Net" : pygame.image.load("VB_BG_Net.png"),
-    "Floor" : pygame.image.load("VB_BG_Floor.png"),
-}
-
-# Increase scale of background images
-new_VB_BG_images = {key: pygame.transform.scale(img, (SCREEN_WIDTH, SCREEN_HEIGHT)) for key, img in volleyball_bg_images.items()}
-
-# Scale player images to 32x32
-player_images = {key: pygame.transform.scale(img, (PLAYER_SIZE, PLAYER_SIZE)) for key, img in player_images.items()}
-
-# scale opponent images up by a factor of 5
-opponent_images = {key: pygame.transform.scale(img, (PLAYER_SIZE * 5, PLAYER_SIZE * 5)) for key, img in opponent_images.items()}
-player_images = {key: pygame.transform.scale(img, (PLAYER_SIZE * 5, PLAYER_SIZE * 5)) for key, img in player_images.items()}
-
-from classes import Player, Ball, NPC_Rect, SPIKER_RECT
+# Images are loaded once, in classes.py
+from classes import Player, Ball, NPC_Rect, SPIKER_RECT, new_VB_BG_images
 
 # Main Game Class
 class VolleyballGame:
-    def __init__(self):
+    def __init__(self, num_players=1):
         # Initialize screen
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption("Volleyball Blocking")
-
-        # Initialize CV Controller
-        self.pose_controller = PoseController()
-        self.pose_controller.start_camera()
+        self.status_font = pygame.font.Font(None, 36)
+        self.screen.fill(ORANGE)
+        self.draw_status_text("Starting camera...")
+        pygame.display.flip()
+
+        # Initialize CV Controller. The model loads and the camera opens in the
+        # background; the game runs as an attract screen until it is ready.
+        # Two players share one camera and one inference per frame (needs the tasks backend).
+        if num_players > 1:
+            self.pose_controller = PoseController(backend="tasks", num_players=num_players, smoothing=True,
+                                                  prediction=True, block_classifier="table")
+        else:
+            self.pose_controller = PoseController(smoothing=True, prediction=True, block_classifier="table")
+        self.pose_controller.start_async()
+        self.last_control_sequences = [0] * num_players
+        self.last_takeoff_times = [None] * num_players
+        self.prearmed = [False] * num_players  # Jump started from the squat, takeoff not seen yet
 
         # Game objects
-        self.player = Player()
+        self.players = [Player() for _ in range(num_players)]
+        self.player = self.players[0]
         self.ball = Ball()
         self.npc_upper = NPC_Rect(SCREEN_HEIGHT // 3 + 100, 'upper')
         self.npc_lower = NPC_Rect(SCREEN_HEIGHT * 2 // 3 + 100, 'lower')
@@ -110,6 +91,14 @@ class VolleyballGame:
         text_rect = kill_block_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2))
         self.screen.blit(kill_block_text, text_rect)
 
+    def draw_status_text(self, text):
+        status_text = self.status_font.render(text, True, BLACK)
+        text_rect = status_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT - 30))
+        self.screen.blit(status_text, text_rect)
+
+    def draw_players(self):
+        for player in self.players:
+            player.draw(self.screen)
 
     def reset_game(self):
         self.ball.rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
@@ -117,8 +106,9 @@ class VolleyballGame:
         self.ball.x_velocity = 0
         self.game_paused = False
         self.kill_block_active = False
-        self.player.BLOCKTYPE = "None"
-        self.player.set_pose("B_Idle")
+        for player in self.players:
+            player.BLOCKTYPE = "None"
+            player.set_pose("B_Idle")
 
     def run(self):
         running = True
@@ -130,37 +120,68 @@ class VolleyballGame:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
-                # if right mouse button is clicked, recalculate the baselines for the player
+                # Baselines recalibrate by themselves when the player stands still; right click starts over
                 if event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:
                     self.pose_controller.baseline_set = False
                     print("Recalculating baselines...")
+                # number keys switch to that camera index without restarting pose detection
+                if event.type == pygame.KEYDOWN and event.unicode.isdigit():
+                    self.pose_controller.switch_camera(int(event.unicode))
+                    print(f"Switching to camera {event.unicode}...")
             
-            # Get controls from pose controller
-            cv_controls = self.pose_controller.get_player_controls()
+            # Get controls from pose controller, once it has finished starting up
+            cv_ready = self.pose_controller.ready.is_set()
+            if cv_ready:
+                now = time.monotonic()
+                all_controls = [self.pose_controller.get_player_controls(now, index)
+                                for index in range(len(self.players))]
+                self.last_control_sequences = [controls['sequence'] for controls in all_controls]
+
+            if not self.game_paused and cv_ready:
+                for index, player in enumerate(self.players):
+                    cv_controls = all_controls[index]
+
+                    # Player movement based on camera x position
+                    screen_x = cv_controls['move_x'] * SCREEN_WIDTH
+                    player.rect.centerx = screen_x
+
+                    # Start the jump when the squat before it says takeoff is due now,
+                    # so the player leaves the floor without waiting for the camera
+                    if (cv_controls['jump_imminent'] and cv_controls['jump_confidence'] >= PREARM_CONFIDENCE
+                            and now >= cv_controls['expected_takeoff_time'] and not player.is_jumping):
+                        player.jump_by_factor(cv_controls['jump_power'])
+                        self.prearmed[index] = True
+                    elif self.prearmed[index] and not cv_controls['jump_imminent'] and not player.is_jumping:
+                        self.prearmed[index] = False  # The takeoff never came
+
+                    # Jumping based on CV detection, once per takeoff. The takeoff was
+                    # detected a few frames late, so run the arc forward to where it
+                    # would be had it started at the real takeoff time.
+                    takeoff_time = cv_controls['takeoff_time']
+                    if cv_controls['jump'] and takeoff_time != self.last_takeoff_times[index]:
+                        self.last_takeoff_times[index] = takeoff_time
+                        if not self.prearmed[index]:
+                            player.jump_by_factor(cv_controls['jump_power'])
+                            for _ in range(min(int((now - takeoff_time) * 60), 15)):
+                                player.update()
+                        self.prearmed[index] = False
+
+                    # Blocking poses based on CV detection
+                    block_mapping = {
+                        "Left": "B_LeftBlock",
+                        "Right": "B_RightBlock", 
+                        "Middle": "B_MiddleBlock",
+                        "Split": "B_SplitBlock",
+                        "None": "B_Idle"
+                    }
+                    block_type = cv_controls['block_type']
+                    player.set_pose(block_mapping.get(block_type, "B_Idle"))
+                    player.BLOCKTYPE = block_type if block_type != "None" else "None"
 
             if not self.game_paused:
-                # Player movement based on camera x position
-                screen_x = cv_controls['move_x'] * SCREEN_WIDTH
-                self.player.rect.centerx = screen_x
-
-                # Jumping based on CV detection
-                if cv_controls['jump']:
-                    self.player.jump_by_factor(cv_controls['jump_power'])
-
-                # Blocking poses based on CV detection
-                block_mapping = {
-                    "Left": "B_LeftBlock",
-                    "Right": "B_RightBlock", 
-                    "Middle": "B_MiddleBlock",
-                    "Split": "B_SplitBlock",
-                    "None": "B_Idle"
-                }
-                block_type = cv_controls['block_type']
-                self.player.set_pose(block_mapping.get(block_type, "B_Idle"))
-                self.player.BLOCKTYPE = block_type if block_type != "None" else "None"
-
-                # Update player
-                self.player.update()
+                # Update players
+                for player in self.players:
+                    player.update()
 
                 # NPC movement
                 self.npc_upper.move_x(self.ball)
@@ -172,7 +193,7 @@ class VolleyballGame:
                 self.ball.collide(self.npc_rects)
 
                 # Check for kill block
-                if self.ball.check_player_block(self.player):
+                if any(self.ball.check_player_block(player) for player in self.players):
                     self.game_paused = True
                     self.kill_block_active = True
                     self.ball.rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
@@ -190,16 +211,16 @@ class VolleyballGame:
             if self.ball.y_velocity > 0 and self.ball.sideinfo == 'lower':
                 pygame.draw.circle(self.screen, GRAY, self.ball.rect.center, BALL_RADIUS)
                 self.screen.blit(new_VB_BG_images["Net"], (0, 0))
-                self.player.draw(self.screen)
+                self.draw_players()
             # if the ball is coming upwards and has side info of upper, draw the ball
             elif self.ball.y_velocity < 0 and self.ball.sideinfo == 'upper':
                 pygame.draw.circle(self.screen, GRAY, self.ball.rect.center, BALL_RADIUS)
                 self.screen.blit(new_VB_BG_images["Net"], (0, 0))
-                self.player.draw(self.screen)
+                self.draw_players()
             else:
                 self.screen.blit(new_VB_BG_images["Net"], (0, 0))
-                # draw player
-                self.player.draw(self.screen)
+                # draw players
+                self.draw_players()
                 pygame.draw.circle(self.screen, GRAY, self.ball.rect.center, BALL_RADIUS)
             
             lower_sprites = pygame.sprite.Group(self.npc_lower)
@@ -207,8 +228,9 @@ class VolleyballGame:
             # self.npc_lower.draw(self.screen)
 
             # Draw block box if any block pose is active
-            if self.player.BLOCKTYPE != "None":
-                self.player.draw_blockbox(self.screen)
+            for player in self.players:
+                if player.BLOCKTYPE != "None":
+                    player.draw_blockbox(self.screen)
 
             # Draw ball
             pygame.draw.circle(self.screen, GRAY, self.ball.rect.center, BALL_RADIUS)
@@ -217,16 +239,26 @@ class VolleyballGame:
             if self.kill_block_active:
                 self.draw_kill_block_text()
 
+            # Attract mode: the rally plays on its own until the camera is ready
+            if not cv_ready:
+                self.draw_status_text(self.pose_controller.status + "...")
+
             pygame.display.flip()
+            if cv_ready:
+                self.pose_controller.frame_displayed(max(self.last_control_sequences))
             self.clock.tick(60)
 
         # Clean up camera when game ends
-        self.pose_controller.stop_camera()
+        self.pose_controller.close()
         pygame.quit()
         sys.exit()
 
 def main():
-    game = VolleyballGame()
+    parser = argparse.ArgumentParser(description="Volleyball blocking game controlled by your pose.")
+    parser.add_argument("--players", type=int, default=1, choices=[1, 2],
+                        help="number of players in front of the camera")
+    args = parser.parse_args()
+    game = VolleyballGame(num_players=args.players)
     game.run()
 
 if __name__ == "__main__":
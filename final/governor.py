@@ -0,0 +1,115 @@
+import time
+from collections import deque
+
+# Quality tiers from best to cheapest. input_width is the width full frames
+# are scaled to before inference; roi_size is the crop canvas in ROI mode.
+QUALITY_TIERS = [
+    {"model_complexity": 2, "input_width": 640, "roi_size": 384},
+    {"model_complexity": 1, "input_width": 640, "roi_size": 256},
+    {"model_complexity": 1, "input_width": 480, "roi_size": 224},
+    {"model_complexity": 0, "input_width": 480, "roi_size": 192},
+    {"model_complexity": 0, "input_width": 320, "roi_size": 160},
+]
+
+
+class QualityGovernor:
+    """
+    Picks a quality tier that keeps inference latency inside a budget.
+
+    Latency is averaged over a window of recent frames. The governor steps
+    down a tier when the average goes over the budget and steps up only
+    when it has stayed well under it (upgrade_ratio) for a full window and
+    the upgrade cooldown has passed. An upgrade that has to be undone
+    straight away doubles the cooldown, so it does not flip back and forth
+    between two tiers.
+
+    The first settle_frames frames after a switch (and at start) are not
+    counted: they include rebuilding the pose graph or warming up the new
+    model, which says nothing about the tier's steady latency.
+    """
+
+    def __init__(self, budget_ms=33.0, tiers=None, start_tier=1, window=30,
+                 downgrade_ratio=1.0, upgrade_ratio=0.6,
+                 downgrade_cooldown=1.0, upgrade_cooldown=5.0, max_upgrade_cooldown=60.0, settle_frames=3):
+        self.budget = budget_ms / 1000.0
+        self.tiers = tiers if tiers is not None else QUALITY_TIERS
+        self.tier = min(start_tier, len(self.tiers) - 1)
+        self.samples = deque(maxlen=window)
+
+        self.downgrade_ratio = downgrade_ratio
+        self.upgrade_ratio = upgrade_ratio
+        self.downgrade_cooldown = downgrade_cooldown
+        self.base_upgrade_cooldown = upgrade_cooldown
+        self.upgrade_cooldown = upgrade_cooldown
+        self.max_upgrade_cooldown = max_upgrade_cooldown
+        self.settle_frames = settle_frames
+        self.settling = settle_frames  # Frames still to skip
+
+        self.last_switch_time = None  # Set by the first record()
+        self.last_switch_was_upgrade = False
+        self.switch_log = []
+
+    @property
+    def settings(self):
+        return self.tiers[self.tier]
+
+    def record(self, latency, now=None):
+        """
+        Add one frame's inference latency in seconds. Returns the new tier's
+        settings if the governor switched, otherwise None.
+        """
+        if now is None:
+            now = time.monotonic()
+        if self.last_switch_time is None:
+            self.last_switch_time = now
+        if self.settling > 0:
+            self.settling -= 1
+            return None
+        self.samples.append(latency)
+        if len(self.samples) < self.samples.maxlen:
+            return None
+
+        mean = sum(self.samples) / len(self.samples)
+        since_switch = now - self.last_switch_time
+
+        if (mean > self.budget * self.downgrade_ratio and self.tier < len(self.tiers) - 1
+                and since_switch >= self.downgrade_cooldown):
+            if self.last_switch_was_upgrade and since_switch < self.upgrade_cooldown:
+                # That upgrade did not hold, wait longer before trying again
+                self.upgrade_cooldown = min(self.upgrade_cooldown * 2, self.max_upgrade_cooldown)
+            return self._switch(self.tier + 1, mean, now, "over budget")
+
+        if (mean < self.budget * self.upgrade_ratio and self.tier > 0
+                and since_switch >= self.upgrade_cooldown):
+            return self._switch(self.tier - 1, mean, now, "under budget")
+
+        if since_switch >= self.max_upgrade_cooldown:
+            # Stable for a long time, forget earlier failed upgrades
+            self.upgrade_cooldown = self.base_upgrade_cooldown
+        return None
+
+    def _switch(self, tier, mean, now, reason):
+        samples = sorted(self.samples)
+        entry = {
+            "time": now,
+            "from_tier": self.tier,
+            "to_tier": tier,
+            "reason": reason,
+            "mean_ms": mean * 1000.0,
+            "p95_ms": samples[int(0.95 * (len(samples) - 1))] * 1000.0,
+            "max_ms": samples[-1] * 1000.0,
+            "budget_ms": self.budget * 1000.0,
+            "settings": self.tiers[tier],
+        }
+        self.switch_log.append(entry)
+        print(f"Quality tier {self.tier} -> {tier} ({reason}): mean {entry['mean_ms']:.1f} ms, "
+              f"p95 {entry['p95_ms']:.1f} ms, max {entry['max_ms']:.1f} ms, "
+              f"budget {entry['budget_ms']:.1f} ms, now {entry['settings']}")
+
+        self.last_switch_was_upgrade = tier < self.tier
+        self.tier = tier
+        self.last_switch_time = now
+        # Measure the new tier from scratch, once it has warmed up
+        self.samples.clear()
+        self.settling = self.settle_frames
+        return self.settings
@@ -0,0 +1,105 @@
+import numpy as np
+
+from landmarks import LANDMARK_COUNT, LANDMARK_FIELDS, Y
+
+
+class LandmarkHistory:
+    """
+    Fixed-size ring of recent landmark arrays, their timestamps and pose flags.
+
+    Everything is preallocated, so appending a frame is a few array writes.
+    "Was this pose seen in the last N seconds" is answered in O(1) from the
+    time each flag was last true; other window queries take one vectorized
+    slice of the ring.
+    """
+
+    def __init__(self, pose_names, capacity=64):
+        self.pose_names = tuple(pose_names)
+        self.pose_index = {name: i for i, name in enumerate(self.pose_names)}
+        self.capacity = capacity
+
+        self.landmarks = np.zeros((capacity, LANDMARK_COUNT, LANDMARK_FIELDS), dtype=np.float32)
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.flags = np.zeros((capacity, len(self.pose_names)), dtype=bool)
+        self.head = 0   # Next slot to write
+        self.count = 0  # Frames appended since the last clear
+
+        # Time each pose was last flagged, kept up to date on every append
+        self.last_true_time = np.full(len(self.pose_names), -np.inf)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        self.last_true_time.fill(-np.inf)
+
+    def append(self, t, landmarks, flags):
+        """Store one frame's landmarks and pose flags, overwriting the oldest."""
+        slot = self.head
+        self.landmarks[slot] = landmarks
+        self.times[slot] = t
+        self.flags[slot] = flags
+
+        flags = self.flags[slot]
+        self.last_true_time[flags] = t
+
+        self.head = (slot + 1) % self.capacity
+        self.count += 1
+
+    @property
+    def latest_time(self):
+        return self.times[(self.head - 1) % self.capacity] if self.count else -np.inf
+
+    def any_within(self, pose, window, now=None):
+        """True if pose was flagged at any frame in the last window seconds. O(1)."""
+        if now is None:
+            now = self.latest_time
+        return self.last_true_time[self.pose_index[pose]] >= now - window
+
+    def poses_within(self, window, now=None):
+        """Boolean array, in pose_names order, of which poses were seen in the window."""
+        if now is None:
+            now = self.latest_time
+        return self.last_true_time >= now - window
+
+    def window_indices(self, window, now=None):
+        """Ring slots of the frames in the last window seconds, oldest first."""
+        n = len(self)
+        if n == 0:
+            return np.empty(0, dtype=np.intp)
+        if now is None:
+            now = self.latest_time
+        order = (self.head - n + np.arange(n)) % self.capacity
+        start = np.searchsorted(self.times[order], now - window, side='left')
+        return order[start:]
+
+    def window(self, window, now=None):
+        """Return (times, landmarks, flags) for the last window seconds, oldest first."""
+        slots = self.window_indices(window, now)
+        return self.times[slots], self.landmarks[slots], self.flags[slots]
+
+    def pose_flags(self, pose, window, now=None):
+        """Flags for one pose over the window, oldest first."""
+        slots = self.window_indices(window, now)
+        return self.flags[slots, self.pose_index[pose]]
+
+    def min_value(self, joints, window, axis=Y, now=None):
+        """Smallest value of the joints' mean coordinate over the window."""
+        slots = self.window_indices(window, now)
+        if len(slots) == 0:
+            return None
+        return float(self.landmarks[slots][:, joints, axis].mean(axis=1).min())
+
+    def max_velocity(self, joints, window, axis=Y, now=None):
+        """Largest absolute speed (units per second) of the joints' mean coordinate over the window."""
+        slots = self.window_indices(window, now)
+        if len(slots) < 2:
+            return 0.0
+        values = self.landmarks[slots][:, joints, axis].mean(axis=1)
+        dt = np.diff(self.times[slots])
+        valid = dt > 0
+        if not valid.any():
+            return 0.0
+        return float(np.abs(np.diff(values)[valid] / dt[valid]).max())
@@ -0,0 +1,241 @@
+from collections import namedtuple
+
+import numpy as np
+
+from landmarks import HIPS, ANKLES, WRISTS, Y
+
+# What the jump detector knows after a frame. Heights are in body heights
+# (nose to floor at calibration) above the calibrated floor; velocities in
+# body heights per second, positive upwards.
+JumpState = namedtuple("JumpState", [
+    "airborne",
+    "takeoff_time",     # time.monotonic() of the last takeoff, between frames, or None
+    "height",           # Current ankle height above the floor
+    "peak_height",      # Expected peak of the current jump from the takeoff speed, 0 on the ground
+    "hip_velocity",
+    "hip_acceleration",
+])
+
+GROUNDED = JumpState(False, None, 0.0, 0.0, 0.0, 0.0)
+
+# Whether a jump is coming, from the countermovement before it. Depth is in
+# body heights below the standing hip height.
+JumpIntent = namedtuple("JumpIntent", [
+    "imminent",
+    "confidence",             # 0 to 1
+    "expected_takeoff_time",  # time.monotonic() the feet should leave the floor, or None
+    "squat_depth",
+])
+
+NO_INTENT = JumpIntent(False, 0.0, None, 0.0)
+
+# Poses that belong to the countermovement
+INTENT_POSES = ("KneesBent", "HeadLowered")
+
+GRAVITY = 9.81  # m/s^2
+
+
+def _fit(times, values):
+    """Velocity and acceleration at the newest sample from a quadratic (or linear) fit."""
+    t = times - times[-1]
+    if len(t) >= 4:
+        a, b, _ = np.polyfit(t, values, 2)
+        return b, 2.0 * a
+    if len(t) >= 2:
+        b, _ = np.polyfit(t, values, 1)
+        return b, 0.0
+    return 0.0, 0.0
+
+
+class JumpDetector:
+    """
+    Detects takeoff from how fast the hips and ankles rise, not from how
+    high the ankles have got.
+
+    Hip and ankle heights over the last fit_window seconds of the landmark
+    history give their upward velocity and acceleration. Takeoff is when
+    the ankles leave the floor by lift_threshold while both are moving up
+    quickly, and they have been down for at least min_ground_time (so
+    jitter at landing does not count as a second jump). Its time is placed
+    between frames by running the ankles' rise back to the floor at their
+    measured speed. While rising, the expected peak is the current height
+    plus what the hips' upward speed will still carry them, using
+    body_height_m to turn body heights into metres.
+
+    With lower_body=False (the ankles are out of view) the hips stand in
+    for the feet: height is how far the hips are above their standing
+    level, which is tracked while the player is on the ground and still
+    (and lowered only slowly, so a held crouch does not become standing).
+    """
+
+    def __init__(self, lift_threshold=0.03, land_threshold=0.015, ankle_speed=0.4, hip_speed=0.3,
+                 fit_window=0.15, min_ground_time=0.15, max_airtime=1.5, body_height_m=1.6,
+                 still_speed=0.1, standing_blend=0.1):
+        self.lift_threshold = lift_threshold
+        self.land_threshold = land_threshold
+        self.ankle_speed = ankle_speed
+        self.hip_speed = hip_speed
+        self.fit_window = fit_window
+        self.min_ground_time = min_ground_time
+        self.max_airtime = max_airtime
+        self.body_height_m = body_height_m
+        self.still_speed = still_speed
+        self.standing_blend = standing_blend
+        self.reset()
+
+    def reset(self):
+        self.state = GROUNDED
+        self.last_grounded_time = None
+        self.landing_time = -np.inf
+        self.standing_hip_y = None  # Image y of the hips when standing, for hip-only detection
+
+    def _peak(self, height, hip_velocity):
+        """Expected peak in body heights: current height plus the rise left in the hips' speed."""
+        speed = max(hip_velocity, 0.0) * self.body_height_m
+        return height + speed * speed / (2.0 * GRAVITY) / self.body_height_m
+
+    def update(self, history, floor_y, body_height, lower_body=True):
+        """Update from the newest frame in history. Returns a JumpState."""
+        times, landmarks, _ = history.window(self.fit_window)
+        if len(times) == 0:
+            return self.state
+        scale = abs(body_height) if abs(body_height) > 1e-3 else 0.5
+        t = float(times[-1])
+
+        # Heights above the floor in body heights (image y points down)
+        hip_y = landmarks[:, HIPS, Y].mean(axis=1)
+        hip_height = (floor_y - hip_y) / scale
+        hip_velocity, hip_acceleration = _fit(times, hip_height)
+        if self.standing_hip_y is None:
+            self.standing_hip_y = float(hip_y[-1])
+        if lower_body:
+            ankle_height = (floor_y - landmarks[:, ANKLES, Y].mean(axis=1)) / scale
+            ankle_velocity, _ = _fit(times, ankle_height)
+            height = max(0.0, float(ankle_height[-1]))
+        else:
+            # The hips' rise above standing stands in for the feet
+            ankle_velocity = hip_velocity
+            height = max(0.0, (self.standing_hip_y - float(hip_y[-1])) / scale)
+
+        state = self.state
+        if not state.airborne:
+            if (height > self.lift_threshold and ankle_velocity > self.ankle_speed
+                    and hip_velocity > self.hip_speed and t - self.landing_time >= self.min_ground_time):
+                # Run the ankles back down to the floor, but not before the last grounded frame
+                takeoff_time = t - height / ankle_velocity
+                if self.last_grounded_time is not None:
+                    takeoff_time = max(takeoff_time, self.last_grounded_time)
+                state = JumpState(True, takeoff_time, height, self._peak(height, hip_velocity),
+                                  hip_velocity, hip_acceleration)
+            else:
+                self.last_grounded_time = t
+                if abs(hip_velocity) < self.still_speed:
+                    # Standing up straighter counts at once, crouching only slowly
+                    blend = self.standing_blend if hip_y[-1] < self.standing_hip_y else self.standing_blend / 10
+                    self.standing_hip_y += blend * (float(hip_y[-1]) - self.standing_hip_y)
+                state = GROUNDED._replace(takeoff_time=state.takeoff_time, height=height,
+                                          hip_velocity=hip_velocity, hip_acceleration=hip_acceleration)
+        else:
+            landed = height < self.land_threshold or t - state.takeoff_time > self.max_airtime
+            if landed:
+                self.last_grounded_time = t
+                self.landing_time = t
+                state = GROUNDED._replace(takeoff_time=state.takeoff_time, height=height,
+                                          hip_velocity=hip_velocity, hip_acceleration=hip_acceleration)
+            else:
+                state = state._replace(height=height, peak_height=max(state.peak_height, height),
+                                       hip_velocity=hip_velocity, hip_acceleration=hip_acceleration)
+        self.state = state
+        return state
+
+
+class JumpIntentPredictor:
+    """
+    Predicts a takeoff from the squat-then-extend movement that comes before it.
+
+    Standing hip height is the highest the hips have been over the last
+    stand_window seconds. A countermovement is the hips dropping at least
+    min_depth below that; the jump is imminent once they have turned and been
+    pushing back up for half of fit_window, at extend_speed or faster. Confidence grows with how deep the squat
+    went, how fast the hips and wrists (the arm swing) are rising, and
+    whether "KneesBent" or "HeadLowered" was seen during it. The expected
+    takeoff is when the hips, at their current speed and acceleration, get
+    back to standing height.
+
+    An intent that is not followed by a takeoff within give_up seconds of
+    its expected time is dropped. The first settle seconds after a landing
+    are ignored, because soaking up a landing looks just like a squat.
+    """
+
+    def __init__(self, min_depth=0.04, full_depth=0.15, extend_speed=0.25, full_speed=1.0,
+                 arm_speed=1.0, stand_window=1.0, fit_window=0.1, max_lead=0.4, give_up=0.2,
+                 settle=0.3, threshold=0.4):
+        self.min_depth = min_depth
+        self.full_depth = full_depth
+        self.extend_speed = extend_speed
+        self.full_speed = full_speed
+        self.arm_speed = arm_speed
+        self.stand_window = stand_window
+        self.fit_window = fit_window
+        self.max_lead = max_lead
+        self.give_up = give_up
+        self.settle = settle
+        self.threshold = threshold
+        self.intent = NO_INTENT
+        self.last_airborne_time = -np.inf
+
+    def reset(self):
+        self.intent = NO_INTENT
+        self.last_airborne_time = -np.inf
+
+    def _time_to_stand(self, depth, velocity, acceleration):
+        """Seconds until hips rising at velocity (and speeding up at acceleration) cover depth."""
+        acceleration = max(acceleration, 0.0)
+        if acceleration > 1e-6:
+            return (np.sqrt(velocity * velocity + 2.0 * acceleration * depth) - velocity) / acceleration
+        return depth / velocity
+
+    def update(self, history, body_height, jump_state):
+        """Update from the newest frame in history and the detector's JumpState. Returns a JumpIntent."""
+        if jump_state.airborne:
+            self.intent = NO_INTENT
+            self.last_airborne_time = history.latest_time
+            return self.intent
+        times, landmarks, flags = history.window(self.stand_window)
+        settled = times >= self.last_airborne_time + self.settle
+        times, landmarks, flags = times[settled], landmarks[settled], flags[settled]
+        if len(times) < 4:
+            return self.intent
+        scale = abs(body_height) if abs(body_height) > 1e-3 else 0.5
+        t = float(times[-1])
+
+        # Heights in body heights (image y points down, so negate)
+        hip_height = -landmarks[:, HIPS, Y].mean(axis=1) / scale
+        wrist_height = -landmarks[:, WRISTS, Y].mean(axis=1) / scale
+        recent = times >= t - self.fit_window
+        hip_velocity, hip_acceleration = _fit(times[recent], hip_height[recent])
+        wrist_velocity, _ = _fit(times[recent], wrist_height[recent])
+
+        # The squat is measured from the standing height before its lowest point
+        bottom = int(np.argmin(hip_height))
+        standing = float(hip_height[:bottom + 1].max())
+        depth = standing - float(hip_height[bottom])
+        remaining = max(standing - float(hip_height[-1]), 0.0)
+
+        intent = self.intent
+        if intent.imminent and t > intent.expected_takeoff_time + self.give_up:
+            intent = NO_INTENT  # Stood back up, or stopped, without jumping
+        rising_for = t - float(times[bottom])
+        if (depth >= self.min_depth and remaining > 0 and rising_for >= self.fit_window / 2
+                and hip_velocity >= self.extend_speed):
+            pose_columns = [history.pose_index[name] for name in INTENT_POSES]
+            posed = flags[:, pose_columns].any(axis=0).mean()
+            confidence = (0.4 * min(depth / self.full_depth, 1.0)
+                          + 0.3 * min(hip_velocity / self.full_speed, 1.0)
+                          + 0.1 * min(max(wrist_velocity, 0.0) / self.arm_speed, 1.0)
+                          + 0.2 * posed)
+            if confidence >= self.threshold:
+                lead = min(self._time_to_stand(remaining, hip_velocity, hip_acceleration), self.max_lead)
+                intent = JumpIntent(True, float(confidence), t + lead, depth)
+        self.intent = intent
+        return intent
@@ -0,0 +1,89 @@
+import numpy as np
+
+# Each frame's pose is a (33, 4) float32 array: one row per MediaPipe Pose
+# landmark, columns x, y, z and visibility. Row numbers match
+# mp.solutions.pose.PoseLandmark.
+LANDMARK_COUNT = 33
+LANDMARK_FIELDS = 4
+
+# Columns
+X = 0
+Y = 1
+Z = 2
+VISIBILITY = 3
+
+# Row names, in MediaPipe order
+LANDMARK_NAMES = (
+    "NOSE",
+    "LEFT_EYE_INNER", "LEFT_EYE", "LEFT_EYE_OUTER",
+    "RIGHT_EYE_INNER", "RIGHT_EYE", "RIGHT_EYE_OUTER",
+    "LEFT_EAR", "RIGHT_EAR",
+    "MOUTH_LEFT", "MOUTH_RIGHT",
+    "LEFT_SHOULDER", "RIGHT_SHOULDER",
+    "LEFT_ELBOW", "RIGHT_ELBOW",
+    "LEFT_WRIST", "RIGHT_WRIST",
+    "LEFT_PINKY", "RIGHT_PINKY",
+    "LEFT_INDEX", "RIGHT_INDEX",
+    "LEFT_THUMB", "RIGHT_THUMB",
+    "LEFT_HIP", "RIGHT_HIP",
+    "LEFT_KNEE", "RIGHT_KNEE",
+    "LEFT_ANKLE", "RIGHT_ANKLE",
+    "LEFT_HEEL", "RIGHT_HEEL",
+    "LEFT_FOOT_INDEX", "RIGHT_FOOT_INDEX",
+)
+LANDMARK_INDEX = {name: i for i, name in enumerate(LANDMARK_NAMES)}
+
+# Rows used by the classifiers
+NOSE = 0
+LEFT_SHOULDER = 11
+RIGHT_SHOULDER = 12
+LEFT_ELBOW = 13
+RIGHT_ELBOW = 14
+LEFT_WRIST = 15
+RIGHT_WRIST = 16
+LEFT_HIP = 23
+RIGHT_HIP = 24
+LEFT_KNEE = 25
+RIGHT_KNEE = 26
+LEFT_ANKLE = 27
+RIGHT_ANKLE = 28
+
+# Left/right pairs, so one fancy index pulls both sides at once
+SHOULDERS = np.array([LEFT_SHOULDER, RIGHT_SHOULDER])
+ELBOWS = np.array([LEFT_ELBOW, RIGHT_ELBOW])
+WRISTS = np.array([LEFT_WRIST, RIGHT_WRIST])
+HIPS = np.array([LEFT_HIP, RIGHT_HIP])
+KNEES = np.array([LEFT_KNEE, RIGHT_KNEE])
+ANKLES = np.array([LEFT_ANKLE, RIGHT_ANKLE])
+
+# Row order after mirroring the image: every LEFT_ row swaps with its RIGHT_ row
+FLIP_PERMUTATION = np.array([
+    LANDMARK_INDEX[name.replace("LEFT", "RIGHT") if "LEFT" in name else name.replace("RIGHT", "LEFT")]
+    for name in LANDMARK_NAMES
+])
+
+
+def landmarks_to_array(landmark_list, out=None):
+    """Copy a MediaPipe landmark list into a (33, 4) float32 array."""
+    if out is None:
+        out = np.empty((LANDMARK_COUNT, LANDMARK_FIELDS), dtype=np.float32)
+    for i, lm in enumerate(landmark_list):
+        out[i, X] = lm.x
+        out[i, Y] = lm.y
+        out[i, Z] = lm.z
+        out[i, VISIBILITY] = lm.visibility
+    return out
+
+
+def mirror_landmarks(landmarks, out=None):
+    """
+    Mirror a pose horizontally, as if the image had been flipped.
+
+    x becomes 1 - x and left/right rows swap, because MediaPipe labels a
+    flipped person's sides the other way round.
+    """
+    if out is None:
+        out = np.empty_like(landmarks)
+    np.take(landmarks, FLIP_PERMUTATION, axis=0, out=out)
+    out[:, X] = 1.0 - out[:, X]
+    return out
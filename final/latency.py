@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+# Pipeline stages in the order a frame passes through them. 'convert' is
+# measured from capture, so it includes the wait in the frame mailbox.
+STAGES = ("capture", "convert", "inference", "classify", "publish", "consume", "flip")
+STAGE_INDEX = {name: i for i, name in enumerate(STAGES)}
+
+
+class LatencyTracker:
+    """
+    Per-frame timestamps for every pipeline stage, keyed by frame sequence.
+
+    Each stage's duration is the time since the previous stage of the same
+    frame. 'end_to_end' runs from capture to the display flip that first
+    showed the frame. Rolling p50 / p95 / p99 are kept over the last
+    'window' frames for every stage.
+
+    Marks come from the inference thread and the game thread, so the small
+    amount of bookkeeping is done under a lock.
+    """
+
+    def __init__(self, window=300, max_pending=64):
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()  # sequence -> array of stage times
+        self.max_pending = max_pending
+
+        self.durations = {name: deque(maxlen=window) for name in STAGES[1:]}
+        self.durations["end_to_end"] = deque(maxlen=window)
+        self.durations["pose_age"] = deque(maxlen=window)  # capture -> consume
+        self.durations["pipeline"] = deque(maxlen=window)  # capture -> publish
+
+    def mark(self, sequence, stage, t=None):
+        """Record that frame `sequence` finished `stage`. Only the first mark per stage counts."""
+        if t is None:
+            t = time.monotonic()
+        index = STAGE_INDEX[stage]
+        with self._lock:
+            times = self._pending.get(sequence)
+            if times is None:
+                if index != 0:
+                    return  # Frame already finished or was evicted
+                times = np.full(len(STAGES), np.nan)
+                self._pending[sequence] = times
+                while len(self._pending) > self.max_pending:
+                    self._pending.popitem(last=False)
+
+            if not np.isnan(times[index]):
+                return
+            times[index] = t
+            if index > 0 and not np.isnan(times[index - 1]):
+                self.durations[stage].append(t - times[index - 1])
+
+            if stage == "publish" and not np.isnan(times[0]):
+                self.durations["pipeline"].append(t - times[0])
+            if stage == "consume" and not np.isnan(times[0]):
+                self.durations["pose_age"].append(t - times[0])
+            if stage == "flip":
+                if not np.isnan(times[0]):
+                    self.durations["end_to_end"].append(t - times[0])
+                del self._pending[sequence]
+
+    def discard(self, sequence):
+        """Forget a frame that will never reach the game (for example, no pose found)."""
+        with self._lock:
+            self._pending.pop(sequence, None)
+
+    def percentiles(self, name):
+        """Rolling p50 / p95 / p99 in milliseconds for one stage, 'end_to_end', 'pose_age' or 'pipeline'."""
+        with self._lock:
+            samples = np.array(self.durations[name])
+        if len(samples) == 0:
+            return {"count": 0, "p50": None, "p95": None, "p99": None}
+        p50, p95, p99 = np.percentile(samples * 1000.0, [50, 95, 99])
+        return {"count": len(samples), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+    def report(self):
+        """Percentiles for every stage and the totals."""
+        return {name: self.percentiles(name) for name in self.durations}
@@ -0,0 +1,167 @@
+"""
+Pose detection on several cameras at once, for two courts or two angles.
+
+Every source gets its own PoseController with its own capture thread and
+pose backend, because a pose graph tracks one video stream. Inference runs
+on a shared pool of worker threads sized to the machine's cores, so more
+cameras than cores still get served, freshest frame first.
+
+    python multi_camera.py 0 1 --seconds 10
+    python multi_camera.py court_a.mp4 court_b.mp4
+
+Numbers are webcam indices; anything else is played as a video file.
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+from camera import CameraConfig, CameraSource, VideoFileSource
+from cv_controller import PoseController
+
+
+def open_source(name):
+    """A webcam for an index like "1", a paced video file for anything else."""
+    if str(name).isdigit():
+        return CameraSource(CameraConfig(index=int(name)))
+    return VideoFileSource(name, realtime=True)
+
+
+class MultiCameraController:
+    """
+    Runs one PoseController per frame source and shares a pool of
+    inference workers between them.
+
+    A source is queued for inference when its capture thread delivers a
+    frame and is never queued twice, so a worker always picks up the
+    source that has waited longest. All sources stamp frames with
+    time.monotonic(), so their snapshots can be compared directly;
+    get_snapshots() returns them together with the spread of their
+    capture times.
+
+    The default "process" backend runs each source's pose graph in its own
+    process, so workers do not compete for the GIL.
+    """
+
+    def __init__(self, sources, workers=None, backend="process", **controller_options):
+        self.sources = list(sources)
+        if workers is None:
+            workers = min(len(self.sources), os.cpu_count() or 1)
+        self.worker_count = max(1, workers)
+        self.controllers = [PoseController(backend=backend, **controller_options) for _ in self.sources]
+
+        self.ready = queue.Queue()  # Indices of sources with a frame waiting
+        self.scheduled = [False] * len(self.sources)
+        self.lock = threading.Lock()
+        self.workers = []
+        self.running = False
+        self.start_time = 0.0
+
+    def start(self):
+        """
+        Load every pose backend and open every source, then start them all
+        reading together, so no source runs ahead while another loads.
+        """
+        for index, controller in enumerate(self.controllers):
+            controller.mailbox.listener = lambda index=index: self._schedule(index)
+            controller.open_camera(self.sources[index])
+
+        # Put paced sources on one clock so file playback lines up. Nothing reads them yet.
+        self.start_time = time.monotonic()
+        for source in self.sources:
+            if hasattr(source, 'start_time'):
+                source.start_time = self.start_time
+
+        self.running = True
+        for _ in range(self.worker_count):
+            worker = threading.Thread(target=self._worker_loop)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        for controller in self.controllers:
+            controller.start_threads(run_inference=False)
+
+    def stop(self):
+        """Stop the workers, then every controller's capture and backend."""
+        self.running = False
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        for controller in self.controllers:
+            controller.close()
+
+    def _schedule(self, index):
+        """Queue a source for inference unless it is already queued or being processed."""
+        with self.lock:
+            if self.scheduled[index]:
+                return
+            self.scheduled[index] = True
+        self.ready.put(index)
+
+    def _worker_loop(self):
+        while self.running:
+            try:
+                index = self.ready.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            controller = self.controllers[index]
+            controller.process_next(timeout=0)
+            with self.lock:
+                self.scheduled[index] = False
+            # A frame that arrived while this one was processed
+            if controller.mailbox.has_frame():
+                self._schedule(index)
+
+    def get_snapshots(self):
+        """
+        Return (snapshots, skew): the latest ControlSnapshot of every source,
+        in source order, and the spread in seconds between the oldest and
+        newest capture time among sources that have seen a pose.
+        """
+        snapshots = [controller.get_snapshot() for controller in self.controllers]
+        times = [snapshot.capture_time for snapshot in snapshots if snapshot.sequence]
+        skew = max(times) - min(times) if times else 0.0
+        return snapshots, skew
+
+    def get_stats(self):
+        """Per-source frame rates and latency percentiles, in source order."""
+        elapsed = time.monotonic() - self.start_time if self.running else 0.0
+        stats = []
+        for index, controller in enumerate(self.controllers):
+            controller_stats = controller.get_stats()
+            stats.append({
+                'source': index,
+                'capture_fps': controller_stats['frames_captured'] / elapsed if elapsed else 0.0,
+                'inference_fps': controller_stats['frames_processed'] / elapsed if elapsed else 0.0,
+                'frames_dropped': controller_stats['frames_dropped'],
+                'inference_ms': controller.latency.percentiles("inference"),
+                'pipeline_ms': controller.latency.percentiles("pipeline"),
+                'snapshot_age': controller_stats['snapshot_age'],
+            })
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run pose detection on several cameras or video files.")
+    parser.add_argument("sources", nargs="+", help="webcam indices or video files")
+    parser.add_argument("--seconds", type=float, default=10.0, help="how long to run")
+    parser.add_argument("--workers", type=int, default=None, help="inference threads (default: one per core)")
+    parser.add_argument("--backend", default="process", help="pose backend for every source")
+    args = parser.parse_args()
+
+    manager = MultiCameraController([open_source(name) for name in args.sources],
+                                    workers=args.workers, backend=args.backend)
+    manager.start()
+    time.sleep(args.seconds)
+    stats = manager.get_stats()
+    _, skew = manager.get_snapshots()
+    manager.stop()
+
+    print(json.dumps(stats, indent=2))
+    print(f"{manager.worker_count} workers, capture skew {skew * 1000.0:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
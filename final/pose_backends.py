@@ -0,0 +1,381 @@
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from landmarks import LANDMARK_COUNT, LANDMARK_FIELDS, landmarks_to_array
+
+
+class LegacyPoseBackend:
+    """Runs mp.solutions.pose.Pose in the calling thread."""
+
+    def __init__(self, min_detection_confidence=0.5, min_tracking_confidence=0.5, model_complexity=1):
+        self.options = {
+            'model_complexity': model_complexity,
+            'min_detection_confidence': min_detection_confidence,
+            'min_tracking_confidence': min_tracking_confidence,
+        }
+        self.pose = self._build()
+
+    def _build(self):
+        import mediapipe as mp
+        return mp.solutions.pose.Pose(**self.options)
+
+    @property
+    def model_complexity(self):
+        return self.options['model_complexity']
+
+    def set_model_complexity(self, model_complexity):
+        """Rebuild the Pose graph with a different model (0, 1 or 2)."""
+        if model_complexity == self.model_complexity:
+            return
+        self.options['model_complexity'] = model_complexity
+        self.pose.close()
+        self.pose = self._build()
+
+    def process(self, image_rgb):
+        """Return a (33, 4) landmark array, or None if no pose was found."""
+        results = self.pose.process(image_rgb)
+        if not results.pose_landmarks:
+            return None
+        return landmarks_to_array(results.pose_landmarks.landmark)
+
+    def close(self):
+        self.pose.close()
+
+
+def _pose_worker(frame_name, result_name, frame_shape, frame_generation, options, model_complexity,
+                 request_event, done_event, ready_event, stop_event, found_pose, request_id, result_id):
+    """Child process entry point. Runs Pose on frames placed in shared memory."""
+    import mediapipe as mp
+
+    frame_shm = shared_memory.SharedMemory(name=frame_name.value.decode())
+    generation = frame_generation.value
+    result_shm = shared_memory.SharedMemory(name=result_name)
+    result = np.ndarray((LANDMARK_COUNT, LANDMARK_FIELDS), dtype=np.float32, buffer=result_shm.buf)
+
+    pose = mp.solutions.pose.Pose(**options)
+    ready_event.set()
+    try:
+        while not stop_event.is_set():
+            if not request_event.wait(0.5):
+                continue
+            request_event.clear()
+            if stop_event.is_set():
+                break
+            if model_complexity.value != options['model_complexity']:
+                # A rebuild request: swap the graph in place rather than paying for a new process
+                options['model_complexity'] = model_complexity.value
+                pose.close()
+                pose = mp.solutions.pose.Pose(**options)
+                ready_event.set()
+            current = request_id.value
+            if current == result_id.value:
+                continue  # Nothing but the rebuild was asked for
+
+            if frame_generation.value != generation:
+                # The parent moved to a bigger buffer
+                frame_shm.close()
+                frame_shm = shared_memory.SharedMemory(name=frame_name.value.decode())
+                generation = frame_generation.value
+            frame = np.ndarray(tuple(frame_shape), dtype=np.uint8, buffer=frame_shm.buf)
+            results = pose.process(frame)
+            del frame
+            if results.pose_landmarks:
+                landmarks_to_array(results.pose_landmarks.landmark, out=result)
+                found_pose.value = 1
+            else:
+                found_pose.value = 0
+            result_id.value = current
+            done_event.set()
+    finally:
+        pose.close()
+        del result
+        frame_shm.close()
+        result_shm.close()
+
+
+class ProcessPoseBackend:
+    """
+    Runs mp.solutions.pose.Pose in a child process.
+
+    Frames go to the child through a shared-memory buffer and the (33, 4)
+    landmark array comes back through a second one, so nothing is pickled
+    per frame. The calling thread only copies the frame and waits on an
+    event, which keeps MediaPipe's work off the game process's GIL.
+
+    The frame buffer is sized for the largest frame seen so far and each
+    request carries its frame's shape, so switching between the full frame
+    and a smaller ROI or scaled-down input does not restart the worker. A
+    bigger frame moves to a bigger buffer, which the worker re-attaches to.
+
+    Every request is numbered and the worker returns the number with its
+    result, so a late answer is never taken for a newer frame's. After a
+    timeout no new frame is written while the worker is still busy: frames
+    are skipped (None) until it answers, and a worker stuck for
+    restart_after seconds is restarted.
+    """
+
+    def __init__(self, min_detection_confidence=0.5, min_tracking_confidence=0.5, model_complexity=1,
+                 timeout=2.0, restart_after=10.0):
+        self.options = {
+            'model_complexity': model_complexity,
+            'min_detection_confidence': min_detection_confidence,
+            'min_tracking_confidence': min_tracking_confidence,
+        }
+        self.timeout = timeout
+        self.restart_after = restart_after
+        self.context = multiprocessing.get_context("spawn")
+        self.process_handle = None
+        self.stalled_since = None  # time.monotonic() of a request that timed out and is still running
+
+    def _start(self, frame_size):
+        """Start the worker process with a frame buffer of frame_size bytes."""
+        self.frame_shm = shared_memory.SharedMemory(create=True, size=frame_size)
+        self.result_shm = shared_memory.SharedMemory(create=True, size=LANDMARK_COUNT * LANDMARK_FIELDS * 4)
+        self.result = np.ndarray((LANDMARK_COUNT, LANDMARK_FIELDS), dtype=np.float32, buffer=self.result_shm.buf)
+
+        # Which buffer holds the frame and what shape it is, read by the worker per request
+        self.frame_name = self.context.Array('c', 64, lock=False)
+        self.frame_name.value = self.frame_shm.name.encode()
+        self.frame_generation = self.context.Value('i', 0, lock=False)
+        self.frame_shape = self.context.Array('i', 3, lock=False)
+        self.model_value = self.context.Value('i', self.model_complexity, lock=False)
+
+        self.request_event = self.context.Event()
+        self.done_event = self.context.Event()
+        self.ready_event = self.context.Event()
+        self.stop_event = self.context.Event()
+        self.found_pose = self.context.Value('i', 0, lock=False)
+        self.request_id = self.context.Value('i', 0, lock=False)
+        self.result_id = self.context.Value('i', 0, lock=False)
+        self.stalled_since = None
+
+        self.process_handle = self.context.Process(
+            target=_pose_worker,
+            args=(self.frame_name, self.result_shm.name, self.frame_shape, self.frame_generation, self.options,
+                  self.model_value,
+                  self.request_event, self.done_event, self.ready_event, self.stop_event, self.found_pose,
+                  self.request_id, self.result_id),
+            daemon=True,
+        )
+        self.process_handle.start()
+
+    def _grow(self, frame_size):
+        """Move frames to a buffer of frame_size bytes. Only called between requests."""
+        old = self.frame_shm
+        self.frame_shm = shared_memory.SharedMemory(create=True, size=frame_size)
+        self.frame_name.value = self.frame_shm.name.encode()
+        self.frame_generation.value += 1
+        old.close()
+        old.unlink()
+
+    @property
+    def model_complexity(self):
+        return self.options['model_complexity']
+
+    def set_model_complexity(self, model_complexity):
+        """
+        Use a different model (0, 1 or 2). The worker rebuilds its graph
+        straight away; the next frame waits for that like it does at startup,
+        outside the per-frame timeout, since a first use may download the model.
+        """
+        if model_complexity == self.model_complexity:
+            return
+        self.options['model_complexity'] = model_complexity
+        if self.process_handle is not None:
+            self.ready_event.clear()
+            self.model_value.value = model_complexity
+            self.request_event.set()
+
+    def _wait_ready(self):
+        """Block until the child has built its Pose graph, however long loading the model takes."""
+        while not self.ready_event.wait(0.1):
+            if not self.process_handle.is_alive():
+                raise RuntimeError("Pose worker exited before it was ready.")
+
+    def _still_busy(self):
+        """True while a timed-out request is still running; restarts a worker stuck too long."""
+        if self.stalled_since is None:
+            return False
+        if self.result_id.value == self.request_id.value:
+            self.stalled_since = None
+            return False
+        if time.monotonic() - self.stalled_since < self.restart_after:
+            return True
+        print("Pose worker is stuck, restarting it.")
+        self.close()
+        return False
+
+    def process(self, image_rgb):
+        """Return a (33, 4) landmark array, or None if no pose was found."""
+        if self._still_busy():
+            return None  # The worker may still be reading the frame buffer
+        if self.process_handle is None:
+            self._start(image_rgb.nbytes)
+        self._wait_ready()
+        if image_rgb.nbytes > self.frame_shm.size:
+            # The camera changed to a bigger resolution
+            self._grow(image_rgb.nbytes)
+
+        frame = np.ndarray(image_rgb.shape, dtype=np.uint8, buffer=self.frame_shm.buf)
+        np.copyto(frame, image_rgb)
+        del frame
+        self.frame_shape[:] = image_rgb.shape
+        request = self.request_id.value + 1
+        self.request_id.value = request
+        self.done_event.clear()
+        self.request_event.set()
+        deadline = time.monotonic() + self.timeout
+        while self.result_id.value != request:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.done_event.wait(remaining):
+                print("Pose worker did not answer in time.")
+                self.stalled_since = time.monotonic()
+                return None
+            self.done_event.clear()
+        if not self.found_pose.value:
+            return None
+        return self.result.copy()
+
+    def close(self):
+        """Stop the worker process and free the shared buffers."""
+        if self.process_handle is None:
+            return
+        self.stop_event.set()
+        self.request_event.set()
+        self.process_handle.join(timeout=5)
+        if self.process_handle.is_alive():
+            self.process_handle.terminate()
+        self.process_handle = None
+
+        del self.result
+        for shm in (self.frame_shm, self.result_shm):
+            shm.close()
+            shm.unlink()
+
+
+# Tasks model bundles by model complexity, looked up next to this file unless
+# model_path is given. Download them from
+# https://storage.googleapis.com/mediapipe-models/pose_landmarker/pose_landmarker_<lite|full|heavy>/float16/latest/pose_landmarker_<lite|full|heavy>.task
+TASK_MODELS = {
+    0: "pose_landmarker_lite.task",
+    1: "pose_landmarker_full.task",
+    2: "pose_landmarker_heavy.task",
+}
+
+
+class TasksPoseBackend:
+    """
+    Runs the MediaPipe Tasks PoseLandmarker in LIVE_STREAM mode.
+
+    Frames go in with detect_async() and a monotonic millisecond timestamp;
+    the graph runs on MediaPipe's own threads and hands the result to a
+    callback. process() waits for the callback of the frame it submitted,
+    so results line up with frames exactly as with the legacy backend.
+    """
+
+    def __init__(self, min_detection_confidence=0.5, min_tracking_confidence=0.5, model_complexity=1,
+                 model_path=None, num_poses=1, timeout=2.0):
+        self.options = {
+            'model_complexity': model_complexity,
+            'min_detection_confidence': min_detection_confidence,
+            'min_tracking_confidence': min_tracking_confidence,
+            'num_poses': num_poses,
+        }
+        self.model_path = model_path  # None picks TASK_MODELS[model_complexity]
+        self.timeout = timeout
+        self.last_timestamp = -1
+
+        self.result_ready = threading.Condition()
+        self.result_timestamp = None
+        self.result_poses = []
+        self.landmarker = self._build()
+
+    def _resolve_model_path(self):
+        if self.model_path is not None:
+            return self.model_path
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), TASK_MODELS[self.model_complexity])
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Pose landmarker model not found: {path}. "
+                                    "Download it or pass model_path.")
+        return path
+
+    def _build(self):
+        import mediapipe as mp
+        from mediapipe.tasks.python import BaseOptions
+        from mediapipe.tasks.python import vision
+
+        self.mp = mp
+        options = vision.PoseLandmarkerOptions(
+            base_options=BaseOptions(model_asset_path=self._resolve_model_path()),
+            running_mode=vision.RunningMode.LIVE_STREAM,
+            num_poses=self.options['num_poses'],
+            min_pose_detection_confidence=self.options['min_detection_confidence'],
+            min_tracking_confidence=self.options['min_tracking_confidence'],
+            result_callback=self._on_result,
+        )
+        return vision.PoseLandmarker.create_from_options(options)
+
+    def _on_result(self, result, output_image, timestamp_ms):
+        """Called on a MediaPipe thread with the landmarks of one frame."""
+        poses = [landmarks_to_array(pose) for pose in result.pose_landmarks]
+        with self.result_ready:
+            self.result_poses = poses
+            self.result_timestamp = timestamp_ms
+            self.result_ready.notify_all()
+
+    @property
+    def model_complexity(self):
+        return self.options['model_complexity']
+
+    def set_model_complexity(self, model_complexity):
+        """Load the lite (0), full (1) or heavy (2) model. Ignored when model_path is fixed."""
+        if model_complexity == self.model_complexity or self.model_path is not None:
+            return
+        self.options['model_complexity'] = model_complexity
+        self.landmarker.close()
+        self.landmarker = self._build()
+
+    def submit(self, image_rgb):
+        """Start detection on a frame without waiting. Returns its timestamp in ms."""
+        # LIVE_STREAM needs strictly increasing timestamps
+        timestamp = max(int(time.monotonic() * 1000), self.last_timestamp + 1)
+        self.last_timestamp = timestamp
+        image = self.mp.Image(image_format=self.mp.ImageFormat.SRGB, data=image_rgb)
+        self.landmarker.detect_async(image, timestamp)
+        return timestamp
+
+    def process_all(self, image_rgb):
+        """Return a list of (33, 4) landmark arrays, one per detected person (may be empty)."""
+        timestamp = self.submit(image_rgb)
+        with self.result_ready:
+            if self.result_ready.wait_for(lambda: self.result_timestamp == timestamp, self.timeout):
+                return self.result_poses
+        print("Pose landmarker did not answer in time.")
+        return []
+
+    def process(self, image_rgb):
+        """Return a (33, 4) landmark array, or None if no pose was found."""
+        poses = self.process_all(image_rgb)
+        return poses[0] if poses else None
+
+    def close(self):
+        self.landmarker.close()
+
+
+BACKENDS = {
+    'legacy': LegacyPoseBackend,
+    'process': ProcessPoseBackend,
+    'tasks': TasksPoseBackend,
+}
+
+
+def create_backend(name, **options):
+    """Build a pose backend by name ('legacy', 'process' or 'tasks')."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown pose backend: {name}. Choose from {', '.join(BACKENDS)}")
+    return BACKENDS[name](**options)
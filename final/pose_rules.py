@@ -0,0 +1,278 @@
+import json
+import os
+
+import numpy as np
+
+from landmarks import LANDMARK_COUNT, LANDMARK_INDEX
+
+# Coordinates that rules can compare. Visibility is not a coordinate.
+AXES = {"x": 0, "y": 1, "z": 2}
+AXIS_COUNT = len(AXES)
+COORD_COUNT = LANDMARK_COUNT * AXIS_COUNT
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pose_rules.json")
+
+
+class RuleSpecError(ValueError):
+    """Raised when a pose rule file cannot be compiled."""
+
+
+class RuleKernel:
+    """
+    Every pose rule from a spec, compiled into a handful of matrices.
+
+    Each comparison in the spec is a linear expression over the landmark
+    coordinates and the baselines, so all of them are evaluated with one
+    matrix product. Distances are two linear expressions (dx, dy) followed
+    by a hypot. Rules are conjunctions of those terms, evaluated with one
+    more product. Works on a single (33, 4) frame or any (..., 33, 4) batch.
+
+    Every rule also knows which landmarks it reads and whether it reads a
+    baseline, so a rule can be skipped (reported as not matching) when one
+    of its joints is out of view.
+    """
+
+    def __init__(self, rule_names, baseline_names, groups, classifiers,
+                 compare_coords, compare_baselines, compare_constants,
+                 distance_coords, distance_baselines, distance_constants,
+                 term_matrix, term_negate):
+        self.rule_names = tuple(rule_names)
+        self.rule_index = {name: i for i, name in enumerate(self.rule_names)}
+        self.baseline_names = tuple(baseline_names)
+        self.groups = groups
+        self.classifiers = classifiers
+
+        self.compare_coords = compare_coords          # (C, 99)
+        self.compare_baselines = compare_baselines    # (C, B)
+        self.compare_constants = compare_constants    # (C,)
+        self.distance_coords = distance_coords        # (D, 2, 99)
+        self.distance_baselines = distance_baselines  # (D, B)
+        self.distance_constants = distance_constants  # (D,)
+        self.term_matrix = term_matrix                # (R, C + D), 1 where a rule needs a term
+        self.term_negate = term_negate                # (C + D,), flips a term's result
+
+        # Landmarks each rule reads, from the nonzero coordinate weights of its terms
+        term_coords = np.concatenate([self.compare_coords != 0,
+                                      (self.distance_coords != 0).any(axis=1)], axis=0)   # (C + D, 99)
+        term_joints = term_coords.reshape(len(term_coords), LANDMARK_COUNT, AXIS_COUNT).any(axis=-1)
+        self.rule_joints = (self.term_matrix @ term_joints.astype(np.float32)) > 0         # (R, 33)
+        self.joint_rules = self.rule_joints.T.astype(np.float32)                          # (33, R)
+        term_baselines = np.concatenate([self.compare_baselines != 0, self.distance_baselines != 0], axis=0)
+        self.rule_uses_baselines = (self.term_matrix @ term_baselines.any(axis=1).astype(np.float32)) > 0
+
+    def usable(self, visible, baselines_valid=True):
+        """
+        (..., R) boolean array of the rules whose landmarks are all in view.
+        visible is a (..., 33) boolean mask; with baselines_valid False,
+        rules that read a baseline are unusable too.
+        """
+        hidden = (~np.asarray(visible, dtype=bool)).astype(np.float32)
+        usable = (hidden @ self.joint_rules) == 0
+        if not baselines_valid:
+            usable &= ~self.rule_uses_baselines
+        return usable
+
+    def evaluate(self, landmarks, baselines, visible=None, baselines_valid=True):
+        """
+        Evaluate every rule. landmarks is (..., 33, 4) and baselines is a
+        sequence in baseline_names order. Returns a (..., R) boolean array.
+
+        Pass a (..., 33) visible mask to skip rules that read a landmark
+        outside it; they come back False.
+        """
+        if visible is not None:
+            usable = self.usable(visible, baselines_valid)
+            if not usable.any():
+                return usable
+            return self.evaluate(landmarks, baselines) & usable
+
+        coords = np.asarray(landmarks, dtype=np.float32)[..., :AXIS_COUNT]
+        coords = coords.reshape(coords.shape[:-2] + (COORD_COUNT,))
+        baselines = np.asarray(baselines, dtype=np.float32)
+
+        terms = []
+        if len(self.compare_constants):
+            values = coords @ self.compare_coords.T
+            values += self.compare_baselines @ baselines + self.compare_constants
+            terms.append(values > 0)
+        if len(self.distance_constants):
+            deltas = np.einsum('...k,dak->...da', coords, self.distance_coords)
+            limits = self.distance_baselines @ baselines + self.distance_constants
+            terms.append(np.hypot(deltas[..., 0], deltas[..., 1]) < limits)
+
+        terms = np.concatenate(terms, axis=-1) ^ self.term_negate
+        failures = (~terms).astype(np.float32) @ self.term_matrix.T
+        return failures == 0
+
+    def select(self, results, group):
+        """Columns of evaluate() output for the rules listed in a group."""
+        return results[..., self.groups[group]]
+
+    def classify(self, results, classifier, usable=None):
+        """
+        Name of the first matching class in an ordered classifier, or its
+        default. For a batch, returns an array of names.
+
+        Pass usable() output to stop at the first class whose rule cannot be
+        evaluated: an earlier class that is out of view might have matched,
+        so it gives the default rather than a later class.
+        """
+        columns, names = self.classifiers[classifier]
+        matches = results[..., columns]
+        # The extra always-true column picks the default when nothing matches
+        matches = np.concatenate([matches, np.ones(matches.shape[:-1] + (1,), dtype=bool)], axis=-1)
+        first = matches.argmax(axis=-1)
+        if usable is not None:
+            # A class out of view before the first match ends the search at the default
+            blocked = np.concatenate([~usable[..., columns], matches[..., -1:]], axis=-1)
+            first = np.where(blocked.argmax(axis=-1) < first, len(columns), first)
+        if np.ndim(first) == 0:
+            return names[int(first)]
+        return np.asarray(names, dtype=object)[first]
+
+    def group_names(self, group):
+        return tuple(self.rule_names[i] for i in self.groups[group])
+
+
+def _joint_rows(names):
+    rows = []
+    for name in names:
+        if name.upper() not in LANDMARK_INDEX:
+            raise RuleSpecError(f"Unknown landmark: {name}")
+        rows.append(LANDMARK_INDEX[name.upper()])
+    return rows
+
+
+def _linear_expression(expr, baseline_index, axis=None):
+    """
+    Turn an expression into (coord weights, baseline weights, constant).
+
+    An expression is a term or a list of terms that are added together:
+      {"joint": "NOSE", "axis": "y"}                mean of one or more joints
+      {"joints": ["LEFT_KNEE", "RIGHT_KNEE"], "axis": "y", "scale": 0.5}
+      {"baseline": "FloorY", "scale": 0.5}
+      {"value": 0.2}
+    """
+    coords = np.zeros(COORD_COUNT, dtype=np.float32)
+    baselines = np.zeros(len(baseline_index), dtype=np.float32)
+    constant = 0.0
+
+    for term in expr if isinstance(expr, list) else [expr]:
+        scale = float(term.get("scale", 1.0))
+        if "joint" in term or "joints" in term:
+            rows = _joint_rows(term["joints"] if "joints" in term else [term["joint"]])
+            term_axis = axis if axis is not None else term.get("axis")
+            if term_axis not in AXES:
+                raise RuleSpecError(f"Joint term needs an axis of x, y or z: {term}")
+            for row in rows:
+                coords[row * AXIS_COUNT + AXES[term_axis]] += scale / len(rows)
+        elif "baseline" in term:
+            if term["baseline"] not in baseline_index:
+                raise RuleSpecError(f"Unknown baseline: {term['baseline']}")
+            baselines[baseline_index[term["baseline"]]] += scale
+        elif "value" in term:
+            constant += scale * float(term["value"])
+        else:
+            raise RuleSpecError(f"Cannot read term: {term}")
+    return coords, baselines, constant
+
+
+def compile_rules(spec):
+    """Compile a rule spec (already parsed from JSON) into a RuleKernel."""
+    baseline_names = spec.get("baselines", [])
+    baseline_index = {name: i for i, name in enumerate(baseline_names)}
+
+    # Classifier classes become ordinary rules named "<classifier>:<class>"
+    rules = dict(spec.get("rules", {}))
+    classifier_specs = {}
+    for classifier, body in spec.get("classifiers", {}).items():
+        names = []
+        for entry in body["classes"]:
+            rules[f"{classifier}:{entry['name']}"] = entry
+            names.append(entry["name"])
+        classifier_specs[classifier] = (names, body.get("default", "None"))
+
+    compares, distances = [], []
+    rule_terms = []
+    for name, rule in rules.items():
+        needed = []
+        for term in rule.get("all", []):
+            negate = bool(term.get("not", False))
+            if "distance" in term:
+                point_a, point_b = term["distance"]
+                dx = (_linear_expression(point_a, baseline_index, "x")[0]
+                      - _linear_expression(point_b, baseline_index, "x")[0])
+                dy = (_linear_expression(point_a, baseline_index, "y")[0]
+                      - _linear_expression(point_b, baseline_index, "y")[0])
+                if term.get("op", "<") != "<":
+                    raise RuleSpecError(f"Distance terms only support '<': {term}")
+                _, limit_baselines, limit_constant = _linear_expression(term["right"], baseline_index)
+                distances.append((np.stack([dx, dy]), limit_baselines, limit_constant))
+                needed.append(("distance", len(distances) - 1, negate))
+            elif "left" in term:
+                op = term.get("op")
+                if op not in ("<", ">"):
+                    raise RuleSpecError(f"Comparison op must be '<' or '>': {term}")
+                left = _linear_expression(term["left"], baseline_index)
+                right = _linear_expression(term["right"], baseline_index)
+                sign = 1.0 if op == ">" else -1.0
+                compares.append((sign * (left[0] - right[0]),
+                                 sign * (left[1] - right[1]),
+                                 sign * (left[2] - right[2])))
+                needed.append(("compare", len(compares) - 1, negate))
+            else:
+                raise RuleSpecError(f"Cannot read rule term in {name}: {term}")
+        rule_terms.append(needed)
+
+    # Compare terms come first in the term vector, then distance terms
+    term_count = len(compares) + len(distances)
+    term_matrix = np.zeros((len(rules), term_count), dtype=np.float32)
+    term_negate = np.zeros(term_count, dtype=bool)
+    for r, needed in enumerate(rule_terms):
+        for kind, i, negate in needed:
+            column = i if kind == "compare" else len(compares) + i
+            term_matrix[r, column] = 1.0
+            term_negate[column] = negate
+
+    baseline_count = len(baseline_names)
+    if compares:
+        compare_coords = np.stack([c[0] for c in compares])
+        compare_baselines = np.stack([c[1] for c in compares])
+        compare_constants = np.array([c[2] for c in compares], dtype=np.float32)
+    else:
+        compare_coords = np.zeros((0, COORD_COUNT), dtype=np.float32)
+        compare_baselines = np.zeros((0, baseline_count), dtype=np.float32)
+        compare_constants = np.zeros(0, dtype=np.float32)
+    if distances:
+        distance_coords = np.stack([d[0] for d in distances])
+        distance_baselines = np.stack([d[1] for d in distances])
+        distance_constants = np.array([d[2] for d in distances], dtype=np.float32)
+    else:
+        distance_coords = np.zeros((0, 2, COORD_COUNT), dtype=np.float32)
+        distance_baselines = np.zeros((0, baseline_count), dtype=np.float32)
+        distance_constants = np.zeros(0, dtype=np.float32)
+
+    rule_names = list(rules)
+    rule_index = {name: i for i, name in enumerate(rule_names)}
+    groups = {}
+    for group, names in spec.get("groups", {}).items():
+        missing = [n for n in names if n not in rule_index]
+        if missing:
+            raise RuleSpecError(f"Group {group} lists unknown rules: {', '.join(missing)}")
+        groups[group] = np.array([rule_index[n] for n in names], dtype=np.intp)
+
+    classifiers = {}
+    for classifier, (names, default) in classifier_specs.items():
+        columns = np.array([rule_index[f"{classifier}:{n}"] for n in names], dtype=np.intp)
+        classifiers[classifier] = (columns, tuple(names) + (default,))
+
+    return RuleKernel(rule_names, baseline_names, groups, classifiers,
+                      compare_coords, compare_baselines, compare_constants,
+                      distance_coords, distance_baselines, distance_constants,
+                      term_matrix, term_negate)
+
+
+def load_rules(path=DEFAULT_RULES_PATH):
+    """Read a JSON rule file and compile it."""
+    with open(path) as f:
+        return compile_rules(json.load(f))
@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+
+
+class RoiCropper:
+    """
+    Crops the camera frame to the area around the player's last pose.
+
+    The box comes from the previous frame's landmarks, padded on every side,
+    and the crop is scaled down into a fixed square canvas so inference
+    always sees the same input size. Landmarks found in the crop are mapped
+    back to full-frame normalized coordinates.
+    """
+
+    def __init__(self, crop_size=256, padding=0.25, min_visibility=0.5, min_landmarks=8):
+        self.crop_size = crop_size
+        self.padding = padding  # Fraction of the box size added on each side
+        self.min_visibility = min_visibility
+        self.min_landmarks = min_landmarks  # Fewer visible than this counts as lost tracking
+
+        # Reused letterbox canvas, always crop_size x crop_size
+        self.canvas = np.zeros((crop_size, crop_size, 3), dtype=np.uint8)
+
+    def set_crop_size(self, crop_size):
+        """Change the canvas size used for cropped inference."""
+        if crop_size != self.crop_size:
+            self.crop_size = crop_size
+            self.canvas = np.zeros((crop_size, crop_size, 3), dtype=np.uint8)
+
+    def compute_box(self, landmarks):
+        """
+        Return a padded (x0, y0, x1, y1) box in normalized coordinates around
+        the visible landmarks, or None if tracking is lost.
+        """
+        if landmarks is None:
+            return None
+        visible = landmarks[:, 3] >= self.min_visibility
+        if np.count_nonzero(visible) < self.min_landmarks:
+            return None
+
+        points = landmarks[visible, :2]
+        x0, y0 = points.min(axis=0)
+        x1, y1 = points.max(axis=0)
+        pad_x = (x1 - x0) * self.padding
+        pad_y = (y1 - y0) * self.padding
+        x0 = max(0.0, x0 - pad_x)
+        y0 = max(0.0, y0 - pad_y)
+        x1 = min(1.0, x1 + pad_x)
+        y1 = min(1.0, y1 + pad_y)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return x0, y0, x1, y1
+
+    def crop(self, image, box):
+        """
+        Cut box out of image and letterbox it into the canvas.
+
+        Returns (canvas, region) where region describes where the crop sits
+        in the full frame and in the canvas, for to_full_frame().
+        """
+        height, width = image.shape[:2]
+        x0 = int(box[0] * width)
+        y0 = int(box[1] * height)
+        x1 = max(x0 + 1, int(np.ceil(box[2] * width)))
+        y1 = max(y0 + 1, int(np.ceil(box[3] * height)))
+
+        crop = image[y0:y1, x0:x1]
+        scale = self.crop_size / max(x1 - x0, y1 - y0)
+        scaled_w = max(1, min(self.crop_size, int(round((x1 - x0) * scale))))
+        scaled_h = max(1, min(self.crop_size, int(round((y1 - y0) * scale))))
+
+        self.canvas.fill(0)
+        cv2.resize(crop, (scaled_w, scaled_h), dst=self.canvas[:scaled_h, :scaled_w],
+                   interpolation=cv2.INTER_AREA)
+
+        region = (x0 / width, y0 / height, (x1 - x0) / width, (y1 - y0) / height,
+                  scaled_w / self.crop_size, scaled_h / self.crop_size)
+        return self.canvas, region
+
+    def to_full_frame(self, landmarks, region):
+        """Map canvas-normalized landmarks back to full-frame coordinates, in place."""
+        left, top, box_w, box_h, fill_w, fill_h = region
+        landmarks[:, 0] = left + landmarks[:, 0] / fill_w * box_w
+        landmarks[:, 1] = top + landmarks[:, 1] / fill_h * box_h
+        # z uses roughly the same scale as x
+        landmarks[:, 2] *= box_w / fill_w
+        return landmarks
@@ -0,0 +1,113 @@
+import itertools
+
+import numpy as np
+
+from landmarks import X, Y, VISIBILITY
+
+
+def pose_box(landmarks, min_visibility=0.5):
+    """(x0, y0, x1, y1) around the visible landmarks, or around all of them if none are visible."""
+    visible = landmarks[:, VISIBILITY] >= min_visibility
+    points = landmarks[visible] if visible.any() else landmarks
+    return (float(points[:, X].min()), float(points[:, Y].min()),
+            float(points[:, X].max()), float(points[:, Y].max()))
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x0, y0, x1, y1) boxes."""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def box_center(box):
+    return (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+
+
+class PoseTracker:
+    """
+    Keeps each person in the same slot from frame to frame.
+
+    Every detection gets a box around its visible landmarks and is matched
+    to the boxes the slots held last, picking the assignment with the lowest
+    total cost. A pair costs its centroid distance minus its overlap (IoU);
+    pairs further apart than max_distance never match. A detection left over
+    takes a free slot, leftmost person first. A slot whose person goes
+    unmatched for max_missed frames is freed. assign() also reports the
+    slots that were freed or taken by a new person, whose per-player state
+    belongs to someone else now. With two or three people,
+    trying every assignment is cheaper than anything cleverer.
+    """
+
+    def __init__(self, slots=2, max_distance=0.3, max_missed=15):
+        self.slots = slots
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.boxes = [None] * slots  # Last box per slot, None when the slot is free
+        self.missed = [0] * slots
+
+    def _cost(self, box, detection_box):
+        (cx, cy), (dx, dy) = box_center(box), box_center(detection_box)
+        distance = float(np.hypot(cx - dx, cy - dy))
+        if distance > self.max_distance:
+            return None
+        return distance - box_iou(box, detection_box)
+
+    def assign(self, detections):
+        """
+        Return a list with one landmark array (or None) per slot, and a list
+        of the slots that were freed or claimed by a new person this frame.
+        """
+        detection_boxes = [pose_box(landmarks) for landmarks in detections]
+        active = [slot for slot in range(self.slots) if self.boxes[slot] is not None]
+
+        # Try every way of giving each active slot one detection or none (-1)
+        best, best_cost = (), None
+        for choice in itertools.product(range(-1, len(detections)), repeat=len(active)):
+            matched = [d for d in choice if d >= 0]
+            if len(matched) != len(set(matched)):
+                continue
+            cost = 0.0
+            for slot, d in zip(active, choice):
+                pair_cost = self.max_distance if d < 0 else self._cost(self.boxes[slot], detection_boxes[d])
+                if pair_cost is None:
+                    break
+                cost += pair_cost
+            else:
+                if best_cost is None or cost < best_cost:
+                    best, best_cost = choice, cost
+
+        assigned = [None] * self.slots
+        changed = []
+        used = set()
+        for slot, d in zip(active, best):
+            if d >= 0:
+                assigned[slot] = detections[d]
+                self.boxes[slot] = detection_boxes[d]
+                self.missed[slot] = 0
+                used.add(d)
+            else:
+                self.missed[slot] += 1
+                if self.missed[slot] > self.max_missed:
+                    self.boxes[slot] = None
+                    changed.append(slot)
+
+        # New people take free slots, left to right
+        new = sorted((d for d in range(len(detections)) if d not in used),
+                     key=lambda d: box_center(detection_boxes[d])[0])
+        free = [slot for slot in range(self.slots) if self.boxes[slot] is None]
+        for slot, d in zip(free, new):
+            assigned[slot] = detections[d]
+            self.boxes[slot] = detection_boxes[d]
+            self.missed[slot] = 0
+            if slot not in changed:
+                changed.append(slot)
+        return assigned, changed
+
+    def clear(self):
+        self.boxes = [None] * self.slots
+        self.missed = [0] * self.slots
@@ -0,0 +1,62 @@
+from landmarks import NOSE, HIPS, KNEES, ANKLES, VISIBILITY, Y
+
+# How much of the body is in view, best first
+FULL_BODY = "full"      # Ankles, knees and hips: jumps from the feet
+HIPS_ONLY = "hips"      # Lower legs out of view: jumps from the hips
+UPPER_BODY = "upper"    # Hips out of view too: no jump detection
+
+# Nose-to-hip drop as a share of nose-to-floor height, for sizing a player
+# whose feet have never been seen
+NOSE_TO_HIP_SHARE = 0.43
+
+
+def visibility_mask(landmarks, min_visibility=0.5):
+    """(..., 33) boolean mask of the landmarks MediaPipe is confident are in view."""
+    return landmarks[..., VISIBILITY] >= min_visibility
+
+
+def body_view(visible):
+    """The best body mode this frame's visibility mask supports."""
+    if visible[HIPS].all():
+        if visible[KNEES].all() and visible[ANKLES].all():
+            return FULL_BODY
+        return HIPS_ONLY
+    return UPPER_BODY
+
+
+def estimate_body_height(landmarks):
+    """Nose-to-floor height (negative, like Baseline_Height) guessed from the nose-to-hip drop."""
+    return (float(landmarks[NOSE, Y]) - float(landmarks[HIPS, Y].mean())) / NOSE_TO_HIP_SHARE
+
+
+class BodyModeTracker:
+    """
+    Picks the body mode from frame visibility, without flickering.
+
+    A new mode is taken only once every frame for hold seconds has
+    supported it, so a single frame with the ankles lost (or found) does
+    not switch jump detection back and forth.
+    """
+
+    def __init__(self, hold=0.25):
+        self.hold = hold
+        self.reset()
+
+    def reset(self):
+        self.mode = None
+        self.candidate = None
+        self.candidate_since = None
+
+    def update(self, visible, t):
+        """Add one frame's visibility mask, captured at time t. Returns the current mode."""
+        view = body_view(visible)
+        if self.mode is None:
+            self.mode = view
+        if view == self.mode:
+            self.candidate = None
+            return self.mode
+        if view != self.candidate:
+            self.candidate, self.candidate_since = view, t
+        elif t - self.candidate_since >= self.hold:
+            self.mode, self.candidate = view, None
+        return self.mode